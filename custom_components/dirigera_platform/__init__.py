@@ -4,10 +4,12 @@ from __future__ import annotations
 import asyncio
 import logging
 
-from dirigera import Hub 
 from .dirigera_lib_patch import HubX
+from .hub_transport import pool_stats
+from .config_flow import entry_settings
 
-from .ikea_gateway import ikea_gateway
+from .ikea_gateway import ikea_gateway, inventory_store, HubDeviceType
+from .hub_coordinator import hub_coordinator
 
 import voluptuous as vol
 
@@ -18,8 +20,49 @@ from homeassistant.const import CONF_IP_ADDRESS, CONF_TOKEN, Platform
 # Import the device class from the component that you want to support
 from homeassistant.core import HomeAssistant
 import homeassistant.helpers.config_validation as cv
-
-from .const import DOMAIN, CONF_HIDE_DEVICE_SET_BULBS, PLATFORM
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+
+from .const import (
+    DOMAIN, 
+    CONF_HIDE_DEVICE_SET_BULBS, 
+    PLATFORM, 
+    HUB,
+    COORDINATOR,
+    CONF_COMMAND_BATCH_WINDOW,
+    DEFAULT_COMMAND_BATCH_WINDOW,
+    CONF_RATE_LIMIT,
+    DEFAULT_RATE_LIMIT,
+    CONF_READ_BATCH_THRESHOLD,
+    DEFAULT_READ_BATCH_THRESHOLD,
+    CONF_EXECUTOR_WORKERS,
+    DEFAULT_EXECUTOR_WORKERS,
+    CONF_CONNECT_TIMEOUT,
+    DEFAULT_CONNECT_TIMEOUT,
+    CONF_READ_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    CONF_OFFLINE_COMMAND_TTL,
+    DEFAULT_OFFLINE_COMMAND_TTL,
+    CONF_SKIP_UNCHANGED_COMMANDS,
+    DEFAULT_SKIP_UNCHANGED_COMMANDS,
+    CONF_SAFETY_NET_POLL_INTERVAL,
+    DEFAULT_SAFETY_NET_POLL_INTERVAL,
+    CONF_LIGHT_POLL_INTERVAL,
+    DEFAULT_LIGHT_POLL_INTERVAL,
+    CONF_BLINDS_POLL_INTERVAL,
+    DEFAULT_BLINDS_POLL_INTERVAL,
+    CONF_OUTLET_POLL_INTERVAL,
+    DEFAULT_OUTLET_POLL_INTERVAL,
+    CONF_AIR_PURIFIER_POLL_INTERVAL,
+    DEFAULT_AIR_PURIFIER_POLL_INTERVAL,
+    CONF_ENVIRONMENT_SENSOR_POLL_INTERVAL,
+    DEFAULT_ENVIRONMENT_SENSOR_POLL_INTERVAL,
+    CONF_CONTROLLER_POLL_INTERVAL,
+    DEFAULT_CONTROLLER_POLL_INTERVAL,
+    CONF_SENSOR_POLL_INTERVAL,
+    DEFAULT_SENSOR_POLL_INTERVAL,
+    CONF_PUSH_ONLY,
+    DEFAULT_PUSH_ONLY
+)
 from .hub_event_listener import hub_event_listener
 
 PLATFORMS_TO_SETUP = [  Platform.SWITCH, 
@@ -43,28 +86,40 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
 
 hub_events = None 
 
+def poll_intervals(hass_data: dict) -> dict:
+    # Seconds between polls per device type, when the hub does not push its changes
+    sensor_interval = hass_data.get(CONF_SENSOR_POLL_INTERVAL, DEFAULT_SENSOR_POLL_INTERVAL)
+    return {
+        HubDeviceType.LIGHT                 : hass_data.get(CONF_LIGHT_POLL_INTERVAL, DEFAULT_LIGHT_POLL_INTERVAL),
+        HubDeviceType.BLIND                 : hass_data.get(CONF_BLINDS_POLL_INTERVAL, DEFAULT_BLINDS_POLL_INTERVAL),
+        HubDeviceType.OUTLET                : hass_data.get(CONF_OUTLET_POLL_INTERVAL, DEFAULT_OUTLET_POLL_INTERVAL),
+        HubDeviceType.AIR_PURIFIER          : hass_data.get(CONF_AIR_PURIFIER_POLL_INTERVAL, DEFAULT_AIR_PURIFIER_POLL_INTERVAL),
+        HubDeviceType.ENVIRONMENT_SENSOR    : hass_data.get(CONF_ENVIRONMENT_SENSOR_POLL_INTERVAL, DEFAULT_ENVIRONMENT_SENSOR_POLL_INTERVAL),
+        HubDeviceType.CONTROLLER            : hass_data.get(CONF_CONTROLLER_POLL_INTERVAL, DEFAULT_CONTROLLER_POLL_INTERVAL),
+        HubDeviceType.OPEN_CLOSE_SENSOR     : sensor_interval,
+        HubDeviceType.MOTION_SENSOR         : sensor_interval,
+        HubDeviceType.WATER_SENSOR          : sensor_interval,
+    }
+
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     logger.debug("Starting async_setup...")
     #for k in config.keys():
     #    logger.debug(f"config key: {k} value: {config[k]}")
     logger.debug("Complete async_setup...")
 
-    def handle_dump_data(call):
-        import dirigera
-
+    async def handle_dump_data(call):
         logger.info("=== START Devices JSON ===")
         key = list(hass.data[DOMAIN].keys())[0]
         
         config_data = hass.data[DOMAIN][key]
         ip = config_data[CONF_IP_ADDRESS]
-        token = config_data[CONF_TOKEN]
+        hub : HubX = config_data[HUB]
         
         logger.info("--------------")
         if ip == "mock":
             logger.info("{ MOCK JSON }")
         else:
-            hub = dirigera.Hub(token, ip)
-            json_resp = hub.get("/devices")
+            json_resp = await hub.async_run_in_executor(hub.get, "/devices")
             logger.debug(f"TYPE IS {type(json_resp)}")
             #import json 
             #devices_json = json.loads(json_resp)
@@ -152,7 +207,23 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
         logger.info("--------------")
 
 
+    def handle_dump_stats(call):
+        for key in hass.data[DOMAIN]:
+            if key == PLATFORM:
+                continue
+            hub : HubX = hass.data[DOMAIN][key][HUB]
+            logger.info(f"=== Hub stats for {hass.data[DOMAIN][key][CONF_IP_ADDRESS]} ===")
+            logger.info(hub.stats())
+            if COORDINATOR in hass.data[DOMAIN][key]:
+                logger.info(f"=== Poll stats for {hass.data[DOMAIN][key][CONF_IP_ADDRESS]} ===")
+                logger.info(hass.data[DOMAIN][key][COORDINATOR].stats())
+        platform = hass.data[DOMAIN].get(PLATFORM)
+        if platform is not None and platform.scene_cache is not None:
+            logger.info("=== Scene cache stats ===")
+            logger.info(platform.scene_cache.stats())
+
     hass.services.async_register(DOMAIN, "dump_data", handle_dump_data)
+    hass.services.async_register(DOMAIN, "dump_stats", handle_dump_stats)
     return True
 
 
@@ -164,7 +235,8 @@ async def async_setup_entry(
     logger.info("Staring async_setup_entry in init...")
     
     hass.data.setdefault(DOMAIN, {})
-    hass_data = dict(entry.data)
+    # The advanced settings changed in the options win over the ones the hub was added with
+    hass_data = entry_settings(entry)
 
     # for backward compatibility
     hide_device_set_bulbs : bool = True 
@@ -184,20 +256,52 @@ async def async_setup_entry(
 
     # Store a reference to the unsubscribe function to cleanup if an entry is unloaded.
     hass_data["unsub_options_update_listener"] = unsub_options_update_listener
+    
+    # One hub client for the entry, its connection pool is shared by all the
+    # platforms and entities. The hub's certificate is self signed, HA closes
+    # the session when the entry is unloaded
+    session_stats = pool_stats()
+    session = async_create_clientsession(hass, verify_ssl=False, trace_configs=[session_stats.make_trace_config()])
+    hub = HubX(
+            hass_data[CONF_TOKEN], 
+            hass_data[CONF_IP_ADDRESS],
+            session=session,
+            session_stats=session_stats,
+            command_batch_window=hass_data.get(CONF_COMMAND_BATCH_WINDOW, DEFAULT_COMMAND_BATCH_WINDOW),
+            rate_limit=hass_data.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT),
+            read_batch_threshold=hass_data.get(CONF_READ_BATCH_THRESHOLD, DEFAULT_READ_BATCH_THRESHOLD),
+            executor_workers=hass_data.get(CONF_EXECUTOR_WORKERS, DEFAULT_EXECUTOR_WORKERS),
+            connect_timeout=hass_data.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=hass_data.get(CONF_READ_TIMEOUT, DEFAULT_READ_TIMEOUT),
+            offline_command_ttl=hass_data.get(CONF_OFFLINE_COMMAND_TTL, DEFAULT_OFFLINE_COMMAND_TTL),
+            elide_commands=hass_data.get(CONF_SKIP_UNCHANGED_COMMANDS, DEFAULT_SKIP_UNCHANGED_COMMANDS))
+    hass_data[HUB] = hub
     hass.data[DOMAIN][entry.entry_id] = hass_data
 
-    hass_data = dict(entry.data)
-    hub = HubX(hass_data[CONF_TOKEN], hass_data[CONF_IP_ADDRESS])
-    
     # Lets get all kinds that we are interested in one go and create the devices
     # such that the platform can go ahead and add the associated sensors
     platform = ikea_gateway()
     hass.data[DOMAIN][PLATFORM] = platform 
+    hub.add_availability_listener(platform.on_hub_availability_changed)
     logger.debug("Starting make_devices...")
-    await platform.make_devices(hass,hass_data[CONF_IP_ADDRESS], hass_data[CONF_TOKEN])
+    store = inventory_store(hass, entry.entry_id)
+    if not await platform.make_devices_from_store(hass, hub, store):
+        await platform.make_devices(hass, hub, store)
     
     #await hass.async_add_executor_job(platform.make_devices,hass, hass_data[CONF_IP_ADDRESS], hass_data[CONF_TOKEN])
     
+    # One poll of the hub for all the devices instead of one per entity
+    if hass_data[CONF_IP_ADDRESS] != "mock":
+        coordinator = hub_coordinator(
+                        hass, 
+                        hub, 
+                        platform,
+                        poll_intervals(hass_data),
+                        hass_data.get(CONF_SAFETY_NET_POLL_INTERVAL, DEFAULT_SAFETY_NET_POLL_INTERVAL),
+                        hass_data.get(CONF_PUSH_ONLY, DEFAULT_PUSH_ONLY))
+        platform.set_coordinator(coordinator)
+        hass_data[COORDINATOR] = coordinator
+    
     # Setup the entities
     #setup_domains = ["switch", "binary_sensor", "light", "sensor", "cover", "fan", "scene"]
     #hass.async_create_task(
@@ -207,11 +311,27 @@ async def async_setup_entry(
     #    await hass.config_entries.async_forward_entry_setup(entry,setup_domain)
     await hass.config_entries.async_forward_entry_setups (entry, PLATFORMS_TO_SETUP)
     
-    # Now lets start the event listender too
-    hub = Hub(hass_data[CONF_TOKEN], hass_data[CONF_IP_ADDRESS])
+    if COORDINATOR in hass_data:
+        hass_data[COORDINATOR].start()
+    
+    # Devices built from the stored inventory are reconciled with the hub in the
+    # background, the empty scenes of the controllers are made after that
+    if hass_data[CONF_IP_ADDRESS] != "mock" and platform.is_stale:
+        entry.async_create_background_task(
+            hass,
+            platform.async_refresh(hass, entry, hub, store),
+            "dirigera_platform_inventory_refresh")
+    elif hass_data[CONF_IP_ADDRESS] != "mock":
+        entry.async_create_background_task(
+            hass,
+            platform.async_make_empty_scenes(hub),
+            "dirigera_platform_empty_scenes")
     
+    # Now lets start the event listender too
     if hass_data[CONF_IP_ADDRESS] != "mock":
-        hub_events = hub_event_listener(hub, hass)
+        hub_events = hub_event_listener(hub, hass, platform.scene_cache)
+        # Polling backs off while the websocket delivers the changes
+        hub_events.add_connection_listener(hass_data[COORDINATOR].on_push_connection_changed)
         hub_events.start()
 
     logger.debug("Complete async_setup_entry...")
@@ -238,13 +358,17 @@ async def async_unload_entry(
         hub_events.stop()
         hub_events = None 
 
-    hass_data = dict(entry.data)
-    hub = HubX(hass_data[CONF_TOKEN], hass_data[CONF_IP_ADDRESS])
+    hub : HubX = hass.data[DOMAIN][entry.entry_id][HUB]
     
     # For each controller if there is an empty scene delete it
     logger.debug("In unload so forcing delete of scenes...")
-    await hass.async_add_executor_job(hub.delete_empty_scenes)
-    logger.debug("Done deleting empty scenes....")
+    try:
+        await hub.async_run_in_executor(hub.delete_empty_scenes)
+        logger.debug("Done deleting empty scenes....")
+    except Exception as ex:
+        # Deleted with the next setup once the hub answers
+        logger.warning("Failed to delete the empty scenes of the controllers...")
+        logger.warning(ex)
     
     """Unload a config entry."""
     unload_ok = all(
@@ -265,12 +389,19 @@ async def async_unload_entry(
     
     hass.data[DOMAIN][entry.entry_id]["unsub_options_update_listener"]()
     hass.data[DOMAIN].pop(entry.entry_id)
+    await hub.async_close()
     logger.debug("Successfully popped entry")
     logger.debug("Complete async_unload_entry")
 
     return unload_ok
 
 
+async def async_remove_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    # The stored device inventory is of no use once the hub is removed
+    await inventory_store(hass, entry.entry_id).async_remove()
+
 async def async_remove_config_entry_device(
     hass: HomeAssistant,
     config_entry: config_entries.ConfigEntry,
@@ -6,6 +6,7 @@ from homeassistant.components.binary_sensor import BinarySensorDeviceClass, Bina
 from homeassistant.components.cover import CoverDeviceClass, CoverEntity,CoverEntityFeature
 from homeassistant.components.datetime import DateTimeEntity
 from homeassistant.helpers.entity import DeviceInfo, Entity, EntityCategory
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.components.fan import FanEntity, FanEntityFeature
 from homeassistant.components.sensor import SensorDeviceClass, SensorEntity
 from homeassistant.components.switch import SwitchDeviceClass, SwitchEntity
@@ -28,18 +29,32 @@ from dirigera.devices.environment_sensor import EnvironmentSensor
 from dirigera.devices.controller import Controller
 from dirigera.devices.air_purifier import FanModeEnum
 
-from .hub_event_listener import hub_event_listener, registry_entry
+from .hub_event_listener import hub_event_listener, registry_entry, are_pushed, event_device_type
+from .hub_resilience import HubUnavailableError
 from .const import DOMAIN
 
 from enum import Enum 
 import logging 
 import math
 import datetime
+import time
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
 DATE_TIME_FORMAT:str = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+# Levels (%) per second a blind is taken to move at till its speed is learned
+BLINDS_DEFAULT_SPEED = 2.5
+# Weight of the latest measured speed in the learned one
+BLINDS_SPEED_WEIGHT = 0.5
+# Moves shorter than this (levels) are too noisy to learn the speed from
+BLINDS_MIN_LEARN_DISTANCE = 10
+# How often the estimated position is shown while a blind moves
+BLINDS_TRACK_INTERVAL = datetime.timedelta(seconds=1)
+# Seconds past the estimated arrival a move is still waited on for the hub to
+# report the final level, after that it is taken as done
+BLINDS_ARRIVAL_GRACE = 10
+
 def induce_properties(class_to_induce, attr):
     for key in attr.keys():
             logger.debug(f"Inducing class {class_to_induce.__name__} property {key} : value {attr[key]}")
@@ -48,7 +63,18 @@ def induce_properties(class_to_induce, attr):
 def make_property(class_to_induce, name, value):
     setattr(class_to_induce, name, property(lambda self: getattr(self._json_data.attributes,name)))
 
+def hub_attribute_name(device, name: str) -> str:
+    # e.g. current_p_m25 -> currentPM25
+    field = type(device._json_data.attributes).model_fields.get(name)
+    if field is None or field.alias is None:
+        return name
+    return field.alias
+
 class ikea_base_device:
+    # Attributes (as named by the hub) shown by the device when it is an entity
+    # itself, None when not known
+    hub_attributes = None
+
     def __init__(self, hass, hub, json_data, get_by_id_fx) -> None:
         logger.debug("ikea_base_device ctor...")
         self._hass = hass 
@@ -57,6 +83,10 @@ class ikea_base_device:
         self._get_by_id_fx = get_by_id_fx
         self._listeners : list[Entity] = []
         self._skip_update = False 
+        # Set while the state comes from the stored inventory and not the hub
+        self.is_stale = False
+        # Set when the hub wide poll (hub_coordinator) refreshes the device
+        self.coordinator = None
 
         # inject properties based on attr
         induce_properties(ikea_base_device, self._json_data.attributes.dict())
@@ -82,12 +112,26 @@ class ikea_base_device:
 
     @property
     def available(self):
-        return self._json_data.is_reachable
+        return self._hub.is_available and self._json_data.is_reachable
 
     @property
     def should_register_with_listener(self):
         return True 
+
+    @property
+    def is_push_only(self) -> bool:
+        # Every entity of the device only shows attributes the hub pushes on the
+        # websocket, the device does not need polling while it is connected
+        entities = [self] + self._listeners if isinstance(self, Entity) else self._listeners
+        if len(entities) == 0:
+            return False
+        device_type = event_device_type(self._json_data.device_type, self._json_data.type)
+        return all(are_pushed(device_type, entity.hub_attributes) for entity in entities)
     
+    @property
+    def assumed_state(self) -> bool:
+        return self.is_stale
+
     @property
     def device_info(self) -> DeviceInfo:
         
@@ -107,13 +151,19 @@ class ikea_base_device:
         return self._json_data.attributes.custom_name
             
     async def async_update(self):
+        # With the hub wide poll the entities are not polled, this is then only
+        # called when an update is asked for (e.g. homeassistant.update_entity)
+        # and reads just this device
         if self.skip_update:
             logger.debug(f"update skipped for {self.name} as marked to skip...")
             return 
         
         logger.debug(f"update called {self.name}")
         try:
-            self._json_data = await self._hass.async_add_executor_job(self._get_by_id_fx, self._json_data.id)
+            self._json_data = await self._get_by_id_fx(self._json_data.id, current=self._json_data)
+        except HubUnavailableError:
+            # Already shown as unavailable, nothing to log
+            logger.debug(f"update skipped for {self.name} as hub is unavailable...")
         except Exception as ex:
             logger.error("error encountered running update on : {}".format(self.name))
             logger.error(ex)
@@ -130,6 +180,9 @@ class ikea_base_device:
             listener.schedule_update_ha_state(force_refresh)
 
 class ikea_base_device_sensor():
+    # Attributes (as named by the hub) the entity shows, None when not known
+    hub_attributes = None
+
     def __init__(self,  device, id_suffix:str = "", name:str = "", native_unit_of_measurement="", icon="", device_class=None, entity_category=None, state_class=None):
         self._device = device
         self._name = name
@@ -150,6 +203,14 @@ class ikea_base_device_sensor():
     def available(self):
         return self._device.available
 
+    @property
+    def should_poll(self) -> bool:
+        return self._device.coordinator is None
+
+    @property
+    def assumed_state(self) -> bool:
+        return self._device.is_stale
+
     @property
     def device_info(self) -> DeviceInfo:
         return self._device.device_info
@@ -188,13 +249,13 @@ class ikea_base_device_sensor():
 
 class ikea_outlet_device(ikea_base_device):
     def __init__(self, hass, hub, json_data):
-        super().__init__(hass, hub, json_data, hub.get_outlet_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_outlet_by_id)
         self.skip_update = True 
     
     async def async_turn_on(self):
         logger.debug("outlet turn_on")
         try:
-            await self._hass.async_add_executor_job(self._json_data.set_on, True)
+            await self._hub.async_set_attributes(self._json_data, {"isOn": True}, skip_unchanged=not self.is_stale)
         except Exception as ex:
             logger.error("error encountered turning on : {}".format(self.name))
             logger.error(ex)
@@ -203,13 +264,15 @@ class ikea_outlet_device(ikea_base_device):
     async def async_turn_off(self):
         logger.debug("outlet turn_off")
         try:
-            await self._hass.async_add_executor_job(self._json_data.set_on, False)
+            await self._hub.async_set_attributes(self._json_data, {"isOn": False}, skip_unchanged=not self.is_stale)
         except Exception as ex:
             logger.error("error encountered turning off : {}".format(self.name))
             logger.error(ex)
             raise HomeAssistantError(ex, DOMAIN, "hub_exception")
 
 class ikea_outlet_switch_sensor(ikea_base_device_sensor, SwitchEntity):
+    hub_attributes = ["isOn"]
+
     def __init__(self, device):
         super().__init__(device = device, name = device.name )
         
@@ -228,10 +291,12 @@ class ikea_outlet_switch_sensor(ikea_base_device_sensor, SwitchEntity):
 class ikea_motion_sensor_device(ikea_base_device):
     def __init__(self,hass, hub, json_data):
         logger.debug("ikea_motion_sensor_device ctor...")
-        super().__init__(hass, hub, json_data, hub.get_motion_sensor_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_motion_sensor_by_id)
         self.skip_update = True 
         
 class ikea_motion_sensor(ikea_base_device_sensor, BinarySensorEntity):  
+    hub_attributes = ["isOn", "isDetected"]
+
     def __init__(self, device: ikea_motion_sensor_device):
         logger.debug("ikea_motion_sensor ctor...")
         # No suffix or name prefix for backward compatibility
@@ -244,10 +309,12 @@ class ikea_motion_sensor(ikea_base_device_sensor, BinarySensorEntity):
 class ikea_open_close_device(ikea_base_device):
     def __init__(self, hass, hub, json_data):
         logger.debug("ikea_motion_sensor_device ctor...")
-        super().__init__(hass, hub, json_data, hub.get_open_close_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_open_close_by_id)
         self.skip_update = True 
 
 class ikea_open_close_sensor(ikea_base_device_sensor, BinarySensorEntity):
+    hub_attributes = ["isOpen"]
+
     def __init__(self, device: ikea_open_close_device):
         logger.debug("ikea_motion_sensor ctor...")
         # No suffix or name prefix for backward compatibility
@@ -263,10 +330,12 @@ class ikea_open_close_sensor(ikea_base_device_sensor, BinarySensorEntity):
 
 class ikea_water_sensor_device(ikea_base_device):
     def __init__(self, hass, hub, json_data):
-        super().__init__(hass, hub, json_data, hub.get_water_sensor_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_water_sensor_by_id)
         self.skip_update = True 
         
 class ikea_water_sensor(ikea_base_device_sensor, BinarySensorEntity):
+    hub_attributes = ["waterLeakDetected"]
+
     def __init__(self, device : ikea_water_sensor_device):
         logger.debug("ikea_water_sensor ctor...")
         super().__init__(device)
@@ -275,26 +344,129 @@ class ikea_water_sensor(ikea_base_device_sensor, BinarySensorEntity):
     def is_on(self):
         return self._device.water_leak_detected
          
+# The hub pushes the target level when a blind is told to move and the current
+# level once it stops. In between the position is estimated from the speed the
+# blind was seen to move at before, and shown every BLINDS_TRACK_INTERVAL
 class ikea_blinds_device(ikea_base_device):
     def __init__(self, hass:core.HomeAssistant, hub:Hub, blind:Blind):
         logger.debug("IkeaBlinds ctor...")
-        super().__init__(hass, hub, blind, hub.get_blinds_by_id)
+        super().__init__(hass, hub, blind, hub.async_get_blinds_by_id)
+        self._speed = BLINDS_DEFAULT_SPEED
+        # (level moved from, when, level moving to) while moving
+        self._movement = None
+        # (level, when) last reported by the hub while moving, to learn the speed from
+        self._reported = None
+        self._unsub_tracking = None
     
     @property
     def device_class(self) -> str:
         return CoverDeviceClass.BLIND
+
+    @property
+    def is_moving(self) -> bool:
+        return self._movement is not None
+
+    @property
+    def estimated_level(self) -> int:
+        if self._movement is None:
+            return self.blinds_current_level
+        from_level, started_at, to_level = self._movement
+        moved = self._speed * (time.monotonic() - started_at)
+        if to_level > from_level:
+            return round(min(to_level, from_level + moved))
+        return round(max(to_level, from_level - moved))
+
+    def on_attributes_pushed(self, keys: set) -> None:
+        if "blindsTargetLevel" in keys or "blindsCurrentLevel" in keys:
+            self._track_movement()
+
+    def _track_movement(self) -> None:
+        now = time.monotonic()
+        current_level = self.blinds_current_level
+        target_level = self.blinds_target_level
+
+        if self._movement is not None:
+            from_level, started_at, to_level = self._movement
+            if current_level == from_level:
+                # Nothing new on where it is (e.g. the hub echoing the target),
+                # carry on from where it is estimated to be
+                if target_level == to_level:
+                    return
+                current_level = self.estimated_level
+            else:
+                reported_level, reported_at = self._reported
+                distance = abs(current_level - reported_level)
+                if distance >= BLINDS_MIN_LEARN_DISTANCE and now > reported_at:
+                    self._speed = (1 - BLINDS_SPEED_WEIGHT) * self._speed + BLINDS_SPEED_WEIGHT * distance / (now - reported_at)
+                    logger.debug(f"Learned speed of blind {self.name} as {self._speed:.2f} levels/second")
+                self._reported = (current_level, now)
+        else:
+            self._reported = (current_level, now)
+
+        if current_level == target_level:
+            self.stop_tracking()
+            return
+
+        self._movement = (current_level, now, target_level)
+        if self._unsub_tracking is None:
+            self._unsub_tracking = async_track_time_interval(self._hass, self._on_tracking_interval, BLINDS_TRACK_INTERVAL)
+
+    def stop_tracking(self) -> None:
+        self._movement = None
+        self._reported = None
+        if self._unsub_tracking is not None:
+            self._unsub_tracking()
+            self._unsub_tracking = None
+
+    @core.callback
+    def _on_tracking_interval(self, now) -> None:
+        from_level, started_at, to_level = self._movement
+        arrival = abs(to_level - from_level) / self._speed
+        if time.monotonic() - started_at > arrival + BLINDS_ARRIVAL_GRACE:
+            # The final level was not reported. It may have stopped short (an
+            # obstacle, a remote) and is not polled while pushed, ask the hub
+            logger.debug(f"Blind {self.name} did not report arriving at {to_level}, reading its level...")
+            self.stop_tracking()
+            self._hass.async_create_task(self._async_read_level())
+        self.async_schedule_update_ha_state(False)
+
+    async def _async_read_level(self) -> None:
+        try:
+            self._json_data = await self._get_by_id_fx(self._json_data.id, current=self._json_data)
+        except HubUnavailableError:
+            # Shown as unavailable till the hub is back and polled again
+            logger.debug(f"level of {self.name} not read as hub is unavailable...")
+            return
+        except Exception as ex:
+            logger.error(f"error encountered reading the level of : {self.name}")
+            logger.error(ex)
+            return
+        self.async_schedule_update_ha_state(False)
+
+    async def async_update(self):
+        if self.is_moving:
+            # The position is estimated till the hub reports where it stopped
+            return
+        await super().async_update()
     
     async def async_open_cover(self):
-        await self._hass.async_add_executor_job(self._json_data.set_target_level, 0)
+        await self._set_target_level(0)
 
     async def async_close_cover(self):
-        await self._hass.async_add_executor_job(self._json_data.set_target_level, 100)
+        await self._set_target_level(100)
 
     async def async_set_cover_position(self, position:int):
         if position >= 0 and position <= 100:
-            await self._hass.async_add_executor_job(self._json_data.set_target_level,100 - position)
+            await self._set_target_level(100 - position)
+
+    async def _set_target_level(self, level: int):
+        if await self._hub.async_set_attributes(self._json_data, {"blindsTargetLevel": level}, skip_unchanged=not self.is_stale):
+            self._track_movement()
+            self.async_schedule_update_ha_state(False)
     
 class ikea_blinds_sensor(ikea_base_device_sensor, CoverEntity):
+    hub_attributes = ["blindsCurrentLevel", "blindsTargetLevel"]
+
     def __init__(self, device:ikea_blinds_device):
         logger.debug("IkeaBlinds ctor...")
         super().__init__(device)
@@ -313,7 +485,7 @@ class ikea_blinds_sensor(ikea_base_device_sensor, CoverEntity):
 
     @property
     def current_cover_position(self):
-        return 100 - self._device.blinds_current_level
+        return 100 - self._device.estimated_level
 
     @property
     def target_cover_position(self):
@@ -327,23 +499,11 @@ class ikea_blinds_sensor(ikea_base_device_sensor, CoverEntity):
 
     @property
     def is_closing(self):
-        if self.current_cover_position is None or self.target_cover_position is False:
-            return False
-
-        if self.current_cover_position != 0 and self.target_cover_position == 0:
-            return True
-
-        return False
+        return self._device.is_moving and self.target_cover_position < self.current_cover_position
 
     @property
     def is_opening(self):
-        if self.current_cover_position is None or self.target_cover_position is False:
-            return False
-
-        if self.current_cover_position != 100 and self.target_cover_position == 100:
-            return True
-
-        return False
+        return self._device.is_moving and self.target_cover_position > self.current_cover_position
 
     async def async_open_cover(self, **kwargs):
         await self._device.async_open_cover()
@@ -355,23 +515,33 @@ class ikea_blinds_sensor(ikea_base_device_sensor, CoverEntity):
         position = int(kwargs["position"])
         await self._device.async_set_cover_position(position)
 
+    async def async_will_remove_from_hass(self) -> None:
+        self._device.stop_tracking()
+
 class ikea_vindstyrka_device(ikea_base_device):
     def __init__(self, hass:core.HomeAssistant, hub:Hub , json_data:EnvironmentSensor) -> None:
-        super().__init__(hass, hub, json_data, hub.get_environment_sensor_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_environment_sensor_by_id)
         self._updated_at = None 
 
     async def async_update(self):        
+        if self.coordinator is not None:
+            return await super().async_update()
+
         if self._updated_at is None or (datetime.datetime.now() - self._updated_at).total_seconds() > 30:
             try:
                 logger.debug("env sensor update called...")
-                self._json_data = await self._hass.async_add_executor_job(self._hub.get_environment_sensor_by_id, self._json_data.id)
+                self._json_data = await self._hub.async_get_environment_sensor_by_id(self._json_data.id, current=self._json_data)
                 self._updated_at = datetime.datetime.now()
+            except HubUnavailableError:
+                logger.debug(f"update skipped for {self.name} as hub is unavailable...")
             except Exception as ex:
                 logger.error(f"error encountered running update on : {self.name}")
                 logger.error(ex)
                 raise HomeAssistantError(ex, DOMAIN, "hub_exception")
 
 class ikea_vindstyrka_temperature(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["currentTemperature"]
+
     def __init__(self, device: ikea_vindstyrka_device) -> None:
         super().__init__(
             device, 
@@ -387,6 +557,8 @@ class ikea_vindstyrka_temperature(ikea_base_device_sensor, SensorEntity):
         return self._device.current_temperature
  
 class ikea_vindstyrka_humidity(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["currentRH"]
+
     def __init__(self, device: ikea_vindstyrka_device) -> None:
         logger.debug("ikea_vindstyrka_humidity ctor...")
         super().__init__(
@@ -416,12 +588,15 @@ class ikea_vindstyrka_pm25(ikea_base_device_sensor, SensorEntity):
         if self._pm25_type == WhichPM25.CURRENT:
             id_suffix = "CURPM25"
             name_suffix = "Current PM2.5"
+            self.hub_attributes = ["currentPM25"]
         if self._pm25_type == WhichPM25.MAX:
             id_suffix = "MAXPM25"
             name_suffix = "Max Measured PM2.5"
+            self.hub_attributes = ["maxMeasuredPM25"]
         if self._pm25_type == WhichPM25.MIN:
             id_suffix = "MINPM25"
             name_suffix = "Min Measured PM2.5"
+            self.hub_attributes = ["minMeasuredPM25"]
         
         super().__init__(device, 
                          id_suffix=id_suffix, 
@@ -441,6 +616,8 @@ class ikea_vindstyrka_pm25(ikea_base_device_sensor, SensorEntity):
         return None
 
 class ikea_vindstyrka_voc_index(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["vocIndex"]
+
     def __init__(self, device: ikea_vindstyrka_device) -> None:
         logger.debug("ikea_vindstyrka_voc_index ctor...")
         super().__init__(
@@ -463,6 +640,8 @@ class ikea_vindstyrka_voc_index(ikea_base_device_sensor, SensorEntity):
 CONTROLLER_BUTTON_MAP = { "SOMRIG shortcut button" : 2 }
 
 class ikea_controller_device(ikea_base_device, SensorEntity):
+    hub_attributes = ["batteryPercentage", "customName"]
+
     def __init__(self,hass:core.HomeAssistant, hub:Hub, json_data:Controller):
         logger.debug("ikea_controller ctor...")
         self._buttons = 1
@@ -470,7 +649,7 @@ class ikea_controller_device(ikea_base_device, SensorEntity):
             self._buttons = CONTROLLER_BUTTON_MAP[json_data.attributes.model]
             logger.debug(f"Set #buttons to {self._buttons} as controller model is : {json_data.attributes.model}")
         
-        super().__init__(hass , hub, json_data, hub.get_controller_by_id)
+        super().__init__(hass , hub, json_data, hub.async_get_controller_by_id)
         self.skip_update = True 
         
     @property
@@ -496,14 +675,31 @@ class ikea_controller_device(ikea_base_device, SensorEntity):
     @property
     def number_of_buttons(self) -> int:
         return self._buttons
+
+    @property
+    def should_poll(self) -> bool:
+        return False
     
     async def async_update(self):  
         pass
 
+    # The controller is the entity itself, battery/name changes pushed by the
+    # hub update its own state (only once added, controllers without battery
+    # are not) and are cascaded to its listeners
+    def async_schedule_update_ha_state(self, force_refresh:bool = False) -> None:
+        if self.hass is not None:
+            SensorEntity.async_schedule_update_ha_state(self, force_refresh)
+        ikea_base_device.async_schedule_update_ha_state(self, force_refresh)
+
+    def schedule_update_ha_state(self, force_refresh:bool = False) -> None:
+        if self.hass is not None:
+            SensorEntity.schedule_update_ha_state(self, force_refresh)
+        ikea_base_device.schedule_update_ha_state(self, force_refresh)
+
 class ikea_starkvind_air_purifier_device(ikea_base_device):
     def __init__(self, hass, hub, json_data) -> None:
         logger.debug("Air purifer Fan device ctor ...")
-        super().__init__(hass, hub, json_data, hub.get_air_purifier_by_id)
+        super().__init__(hass, hub, json_data, hub.async_get_air_purifier_by_id)
         self._updated_at = None
 
     @property
@@ -533,13 +729,18 @@ class ikea_starkvind_air_purifier_device(ikea_base_device):
         #return self.fan_mode
     
     async def async_update(self):
+        if self.coordinator is not None:
+            return await super().async_update()
+
         if (
             self._updated_at is None
             or (datetime.datetime.now() - self._updated_at).total_seconds() > 30
         ):
             try:
-                self._json_data = await self._hass.async_add_executor_job(self._hub.get_air_purifier_by_id, self._json_data.id)
+                self._json_data = await self._hub.async_get_air_purifier_by_id(self._json_data.id, current=self._json_data)
                 self._updated_at = datetime.datetime.now()
+            except HubUnavailableError:
+                logger.debug(f"update skipped for {self.name} as hub is unavailable...")
             except Exception as ex:
                 logger.error("error encountered running update on : {}".format(self.name))
                 logger.error(ex)
@@ -549,19 +750,19 @@ class ikea_starkvind_air_purifier_device(ikea_base_device):
         # Convert percent to speed
         desired_speed = math.ceil(percentage * 50 / 100)
         logger.debug("set_percentage got : {}, scaled to : {}".format(percentage, desired_speed))
-        await self._hass.async_add_executor_job(self._json_data.set_motor_state, desired_speed)
+        await self._hub.async_set_attributes(self._json_data, {"motorState": desired_speed}, skip_unchanged=not self.is_stale)
 
     async def async_set_status_light(self, status: bool) -> None:
         logger.debug("set_status_light : {}".format(status))
-        await self._hass.async_add_executor_job(self._json_data.set_status_light, status)
+        await self._hub.async_set_attributes(self._json_data, {"statusLight": status}, skip_unchanged=not self.is_stale)
 
     async def async_set_child_lock(self, status: bool) -> None:
         logger.debug("set_child_lock : {}".format(status))
-        await self._hass.async_add_executor_job(self._json_data.set_child_lock, status)
+        await self._hub.async_set_attributes(self._json_data, {"childLock": status}, skip_unchanged=not self.is_stale)
 
     async def async_set_fan_mode(self, preset_mode: FanModeEnum) -> None:
         logger.debug("set_fan_mode : {}".format(preset_mode.value))
-        await self._hass.async_add_executor_job(self._json_data.set_fan_mode, preset_mode)
+        await self._hub.async_set_attributes(self._json_data, {"fanMode": preset_mode}, skip_unchanged=not self.is_stale)
 
     async def async_set_preset_mode(self, preset_mode: str):
         logger.debug("set_preset_mode : {}".format(preset_mode))
@@ -584,7 +785,7 @@ class ikea_starkvind_air_purifier_device(ikea_base_device):
 
         logger.debug("set_preset_mode equated to : {}".format(mode_to_set.value))
         #await self._hass.async_add_executor_job(self.async_set_fan_mode, mode_to_set)
-        await self._hass.async_add_executor_job(self._json_data.set_fan_mode, mode_to_set)
+        await self._hub.async_set_attributes(self._json_data, {"fanMode": mode_to_set}, skip_unchanged=not self.is_stale)
         
     async def async_turn_on(self, percentage=None, preset_mode=None) -> None:
         logger.debug("Airpurifier call to turn_on with percentage: {}, preset_mode: {}".format(percentage, preset_mode))
@@ -608,6 +809,8 @@ class ikea_starkvind_air_purifier_device(ikea_base_device):
         #await self._hass.async_add_executor_job(self.set_percentage, 0)
 
 class ikea_starkvind_air_purifier_fan(ikea_base_device_sensor, FanEntity):
+    hub_attributes = ["fanMode", "motorState"]
+
     def __init__(self, device: ikea_starkvind_air_purifier_device) -> None:
         logger.debug("Air purifer Fan sensor ctor ...")
         super().__init__(device)
@@ -668,6 +871,7 @@ class ikea_starkvind_air_purifier_sensor(ikea_base_device_sensor, SensorEntity):
                     icon=icon_name)
 
         self._native_value_prop = native_value_prop
+        self.hub_attributes = [hub_attribute_name(device, native_value_prop)]
 
     @property
     def native_value(self):
@@ -697,6 +901,7 @@ class ikea_starkvind_air_purifier_binary_sensor(ikea_base_device_sensor, BinaryS
                             icon=icon_name)
         
         self._native_value_prop = native_value_prop
+        self.hub_attributes = [hub_attribute_name(device, native_value_prop)]
         device.add_listener(self)
     
     @property
@@ -726,6 +931,7 @@ class ikea_starkvind_air_purifier_switch_sensor(ikea_base_device_sensor, SwitchE
                             device_class=SwitchDeviceClass.OUTLET,
                             icon=icon_name)
         self._is_on_prop = is_on_prop
+        self.hub_attributes = [hub_attribute_name(device, is_on_prop)]
         self._turn_on_off = getattr(self._device, turn_on_off_fx)
 
     @property
@@ -751,6 +957,8 @@ class ikea_starkvind_air_purifier_switch_sensor(ikea_base_device_sensor, SwitchE
             raise HomeAssistantError(ex, DOMAIN, "hub_exception")
                     
 class battery_percentage_sensor(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["batteryPercentage"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -767,6 +975,8 @@ class battery_percentage_sensor(ikea_base_device_sensor, SensorEntity):
         return getattr(self._device, "battery_percentage")
     
 class current_amps_sensor(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["currentAmps"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -783,6 +993,8 @@ class current_amps_sensor(ikea_base_device_sensor, SensorEntity):
         return getattr(self._device, "current_amps")
 
 class current_active_power_sensor(ikea_base_device_sensor, SensorEntity):   
+    hub_attributes = ["currentActivePower"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -797,6 +1009,8 @@ class current_active_power_sensor(ikea_base_device_sensor, SensorEntity):
         return getattr(self._device, "current_active_power")
     
 class current_voltage_sensor(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["currentVoltage"]
+
     
     def __init__(self, device):
         super().__init__(
@@ -814,6 +1028,8 @@ class current_voltage_sensor(ikea_base_device_sensor, SensorEntity):
         return getattr(self._device, "current_voltage")
     
 class total_energy_consumed_sensor(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["totalEnergyConsumed"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -829,6 +1045,8 @@ class total_energy_consumed_sensor(ikea_base_device_sensor, SensorEntity):
         return getattr(self._device, "total_energy_consumed")
     
 class energy_consumed_at_last_reset_sensor(ikea_base_device_sensor, SensorEntity):
+    hub_attributes = ["energyConsumedAtLastReset"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -844,6 +1062,8 @@ class energy_consumed_at_last_reset_sensor(ikea_base_device_sensor, SensorEntity
         return getattr(self._device, "energy_consumed_at_last_reset")
 
 class time_of_last_energy_reset_sensor(ikea_base_device_sensor, DateTimeEntity):
+    hub_attributes = ["timeOfLastEnergyReset"]
+
     def __init__(self, device):
         super().__init__(
                             device = device, 
@@ -876,6 +1096,8 @@ class time_of_last_energy_reset_sensor(ikea_base_device_sensor, DateTimeEntity):
             logger.warning(f"Failed to set time_of_last_energy_reset in sensor using value : {value}")
  
 class total_energy_consumed_last_updated_sensor(ikea_base_device_sensor, DateTimeEntity):
+    hub_attributes = ["totalEnergyConsumedLastUpdated"]
+
     def __init__(self, device):
         super().__init__(   device,
                             id_suffix="TECLU01",
@@ -11,7 +11,44 @@ from homeassistant.const import CONF_IP_ADDRESS, CONF_TOKEN
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
 
-from .const import DOMAIN, CONF_HIDE_DEVICE_SET_BULBS
+from .const import (
+    DOMAIN, 
+    CONF_HIDE_DEVICE_SET_BULBS,
+    CONF_COMMAND_BATCH_WINDOW,
+    DEFAULT_COMMAND_BATCH_WINDOW,
+    CONF_RATE_LIMIT,
+    DEFAULT_RATE_LIMIT,
+    CONF_READ_BATCH_THRESHOLD,
+    DEFAULT_READ_BATCH_THRESHOLD,
+    CONF_EXECUTOR_WORKERS,
+    DEFAULT_EXECUTOR_WORKERS,
+    CONF_CONNECT_TIMEOUT,
+    DEFAULT_CONNECT_TIMEOUT,
+    CONF_READ_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    CONF_OFFLINE_COMMAND_TTL,
+    DEFAULT_OFFLINE_COMMAND_TTL,
+    CONF_SKIP_UNCHANGED_COMMANDS,
+    DEFAULT_SKIP_UNCHANGED_COMMANDS,
+    CONF_SAFETY_NET_POLL_INTERVAL,
+    DEFAULT_SAFETY_NET_POLL_INTERVAL,
+    CONF_LIGHT_POLL_INTERVAL,
+    DEFAULT_LIGHT_POLL_INTERVAL,
+    CONF_BLINDS_POLL_INTERVAL,
+    DEFAULT_BLINDS_POLL_INTERVAL,
+    CONF_OUTLET_POLL_INTERVAL,
+    DEFAULT_OUTLET_POLL_INTERVAL,
+    CONF_AIR_PURIFIER_POLL_INTERVAL,
+    DEFAULT_AIR_PURIFIER_POLL_INTERVAL,
+    CONF_ENVIRONMENT_SENSOR_POLL_INTERVAL,
+    DEFAULT_ENVIRONMENT_SENSOR_POLL_INTERVAL,
+    CONF_CONTROLLER_POLL_INTERVAL,
+    DEFAULT_CONTROLLER_POLL_INTERVAL,
+    CONF_SENSOR_POLL_INTERVAL,
+    DEFAULT_SENSOR_POLL_INTERVAL,
+    CONF_PUSH_ONLY,
+    DEFAULT_PUSH_ONLY
+)
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
@@ -20,8 +57,57 @@ HUB_SCHEMA = vol.Schema({
     vol.Optional(CONF_HIDE_DEVICE_SET_BULBS, default=True): cv.boolean
     })
 
+# Tuning of how the integration talks to the hub, only shown in advanced mode.
+# setting -> (default, validator)
+ADVANCED_SCHEMA = {
+    CONF_COMMAND_BATCH_WINDOW             : (DEFAULT_COMMAND_BATCH_WINDOW, vol.All(vol.Coerce(int), vol.Range(min=0, max=100))),
+    CONF_RATE_LIMIT                       : (DEFAULT_RATE_LIMIT, vol.All(vol.Coerce(int), vol.Range(min=0, max=100))),
+    CONF_READ_BATCH_THRESHOLD             : (DEFAULT_READ_BATCH_THRESHOLD, vol.All(vol.Coerce(int), vol.Range(min=0, max=100))),
+    CONF_EXECUTOR_WORKERS                 : (DEFAULT_EXECUTOR_WORKERS, vol.All(vol.Coerce(int), vol.Range(min=1, max=16))),
+    CONF_CONNECT_TIMEOUT                  : (DEFAULT_CONNECT_TIMEOUT, vol.All(vol.Coerce(int), vol.Range(min=1, max=60))),
+    CONF_READ_TIMEOUT                     : (DEFAULT_READ_TIMEOUT, vol.All(vol.Coerce(int), vol.Range(min=1, max=60))),
+    CONF_OFFLINE_COMMAND_TTL              : (DEFAULT_OFFLINE_COMMAND_TTL, vol.All(vol.Coerce(int), vol.Range(min=0, max=3600))),
+    CONF_SKIP_UNCHANGED_COMMANDS          : (DEFAULT_SKIP_UNCHANGED_COMMANDS, cv.boolean),
+    CONF_SAFETY_NET_POLL_INTERVAL         : (DEFAULT_SAFETY_NET_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_LIGHT_POLL_INTERVAL              : (DEFAULT_LIGHT_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_BLINDS_POLL_INTERVAL             : (DEFAULT_BLINDS_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_OUTLET_POLL_INTERVAL             : (DEFAULT_OUTLET_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_AIR_PURIFIER_POLL_INTERVAL       : (DEFAULT_AIR_PURIFIER_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_ENVIRONMENT_SENSOR_POLL_INTERVAL : (DEFAULT_ENVIRONMENT_SENSOR_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_CONTROLLER_POLL_INTERVAL         : (DEFAULT_CONTROLLER_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_SENSOR_POLL_INTERVAL             : (DEFAULT_SENSOR_POLL_INTERVAL, vol.All(vol.Coerce(int), vol.Range(min=5, max=86400))),
+    CONF_PUSH_ONLY                        : (DEFAULT_PUSH_ONLY, cv.boolean),
+    }
+
+ADVANCED_SETTINGS = [str(key) for key in ADVANCED_SCHEMA]
+
 NULL_SCHEMA = vol.Schema({})
 
+def settings_schema(advanced_settings: Dict[str, Any] = None) -> vol.Schema:
+    # Defaults are the settings of the entry, else submitting the form puts
+    # back the default of everything that was tuned
+    if advanced_settings is None:
+        advanced_settings = {}
+    return vol.Schema({
+        vol.Optional(key, default=advanced_settings.get(key, default)) : validator
+        for key, (default, validator) in ADVANCED_SCHEMA.items()
+    })
+
+def hub_schema(show_advanced_options: bool) -> vol.Schema:
+    if not show_advanced_options:
+        return HUB_SCHEMA
+    return HUB_SCHEMA.extend(settings_schema().schema)
+
+def get_advanced_settings(user_input: Dict[str, Any]) -> Dict[str, Any]:
+    return { key : user_input[key] for key in ADVANCED_SETTINGS if key in user_input }
+
+def entry_settings(config_entry: config_entries.ConfigEntry) -> Dict[str, Any]:
+    # The advanced settings changed in the options win over the ones given when
+    # the hub was added
+    settings = dict(config_entry.data)
+    settings.update(get_advanced_settings(config_entry.options))
+    return settings
+
 
 def get_dirigera_token_step_one(ip_address):
     logger.debug("In generate token step one ")
@@ -48,6 +134,7 @@ class dirigera_platform_config_flow(config_entries.ConfigFlow, domain=DOMAIN):
         self.code = None
         self.hide_device_set_bulbs = True 
         self.code_verifier = None
+        self.advanced_settings = {}
 
     async def async_step_user(
         self, user_input: Dict[str, Any] = None
@@ -63,6 +150,7 @@ class dirigera_platform_config_flow(config_entries.ConfigFlow, domain=DOMAIN):
 
             self.ip = user_input[CONF_IP_ADDRESS]
             self.hide_device_set_bulbs = user_input[CONF_HIDE_DEVICE_SET_BULBS]
+            self.advanced_settings = get_advanced_settings(user_input)
 
             if self.ip is None or len(self.ip.strip()) == 0:
                 logger.debug("IP specified is blank...")
@@ -90,7 +178,7 @@ class dirigera_platform_config_flow(config_entries.ConfigFlow, domain=DOMAIN):
                     errors["base"] = "hub_connection_fail"
 
         return self.async_show_form(
-            step_id="user", data_schema=HUB_SCHEMA, errors=errors
+            step_id="user", data_schema=hub_schema(self.show_advanced_options), errors=errors
         )
 
     async def async_step_action(
@@ -116,6 +204,7 @@ class dirigera_platform_config_flow(config_entries.ConfigFlow, domain=DOMAIN):
             user_input[CONF_IP_ADDRESS] = self.ip
             user_input[CONF_TOKEN] = token
             user_input[CONF_HIDE_DEVICE_SET_BULBS] = self.hide_device_set_bulbs
+            user_input.update(self.advanced_settings)
 
             return self.async_create_entry(
                 title="IKEA Dirigera Hub : {}".format(user_input[CONF_IP_ADDRESS]),
@@ -143,19 +232,42 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         logger.debug(config_entry.data)
 
         self.config_entry = config_entry
+        # Carry forward what was set earlier
+        self.advanced_settings = get_advanced_settings(entry_settings(config_entry))
 
     async def async_step_init(
         self, user_input: Dict[str, Any] = None
     ) -> Dict[str, Any]:
         # Called when configure is called from an existing configured integration
+        # A new token takes a press of the hub's action button, tuning the
+        # integration does not so the two are apart
+        if not self.show_advanced_options:
+            return await self.async_step_hub()
+        return self.async_show_menu(step_id="init", menu_options=["hub", "settings"])
+
+    async def async_step_settings(
+        self, user_input: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        logger.debug("OPTIONS async_step_settings called....")
+        if user_input is not None:
+            # Only the options change, the entry is reloaded with them
+            return self.async_create_entry(title="", data=get_advanced_settings(user_input))
+
+        return self.async_show_form(
+            step_id="settings", data_schema=settings_schema(self.advanced_settings)
+        )
+
+    async def async_step_hub(
+        self, user_input: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
         # The first screen that is shown, asl called after IP when submitted
 
-        logger.error("OPTIONS async_step_init called....")
+        logger.error("OPTIONS async_step_hub called....")
         logger.error(user_input)
 
         errors: Dict[str, str] = {}
 
-        if user_input is not None:
+        if user_input is not None and CONF_IP_ADDRESS in user_input:
             logger.error("async step init user input is not none...")
             logger.error("user_input is ")
             logger.error(user_input)
@@ -190,7 +302,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     errors["base"] = "hub_connection_fail"
 
         return self.async_show_form(
-            step_id="init", data_schema=HUB_SCHEMA, errors=errors
+            step_id="hub", data_schema=HUB_SCHEMA, errors=errors
         )
 
     async def async_step_action(
@@ -218,6 +330,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             user_input[CONF_IP_ADDRESS] = self.ip
             user_input[CONF_TOKEN] = token
             user_input[CONF_HIDE_DEVICE_SET_BULBS] = self.hide_device_set_bulbs
+            user_input.update(self.advanced_settings)
             logger.error("before create entry...")
             logger.error(user_input)
 
@@ -225,9 +338,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                                                         title="IKEA Dirigera Hub : {}".format(user_input[CONF_IP_ADDRESS]),)
             #return self.async_create_entry(title=None, data=None)
             #return self.config_entry.async_update_entry(user_input)
+            # The options (advanced settings) are left as they are
             return self.async_create_entry(
                 title="IKEA Dirigera Hub : {}".format(user_input[CONF_IP_ADDRESS]),
-                data=user_input,
+                data=dict(self.config_entry.options),
             )
         except Exception as ex:
             logger.error("Failed to connect to dirigera hub")
@@ -235,5 +349,5 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             errors["base"] = "hub_connection_fail"
 
         return self.async_show_form(
-            step_id="init", data_schema=NULL_SCHEMA, errors=errors
+            step_id="hub", data_schema=NULL_SCHEMA, errors=errors
         )
@@ -1,3 +1,41 @@
 DOMAIN = "dirigera_platform"
 PLATFORM="dirigera_platform"
 CONF_HIDE_DEVICE_SET_BULBS="hide_device_set_bulbs"
+HUB="hub"
+COORDINATOR="coordinator"
+
+# Advanced settings, shown in the config/options flow in advanced mode
+CONF_COMMAND_BATCH_WINDOW="command_batch_window"
+DEFAULT_COMMAND_BATCH_WINDOW=0
+CONF_RATE_LIMIT="rate_limit"
+DEFAULT_RATE_LIMIT=10
+CONF_READ_BATCH_THRESHOLD="read_batch_threshold"
+DEFAULT_READ_BATCH_THRESHOLD=5
+CONF_EXECUTOR_WORKERS="executor_workers"
+DEFAULT_EXECUTOR_WORKERS=2
+CONF_CONNECT_TIMEOUT="connect_timeout"
+DEFAULT_CONNECT_TIMEOUT=5
+CONF_READ_TIMEOUT="read_timeout"
+DEFAULT_READ_TIMEOUT=10
+CONF_OFFLINE_COMMAND_TTL="offline_command_ttl"
+DEFAULT_OFFLINE_COMMAND_TTL=0
+CONF_SKIP_UNCHANGED_COMMANDS="skip_unchanged_commands"
+DEFAULT_SKIP_UNCHANGED_COMMANDS=True
+CONF_SAFETY_NET_POLL_INTERVAL="safety_net_poll_interval"
+DEFAULT_SAFETY_NET_POLL_INTERVAL=600
+CONF_LIGHT_POLL_INTERVAL="light_poll_interval"
+DEFAULT_LIGHT_POLL_INTERVAL=30
+CONF_BLINDS_POLL_INTERVAL="blinds_poll_interval"
+DEFAULT_BLINDS_POLL_INTERVAL=30
+CONF_OUTLET_POLL_INTERVAL="outlet_poll_interval"
+DEFAULT_OUTLET_POLL_INTERVAL=30
+CONF_AIR_PURIFIER_POLL_INTERVAL="air_purifier_poll_interval"
+DEFAULT_AIR_PURIFIER_POLL_INTERVAL=30
+CONF_ENVIRONMENT_SENSOR_POLL_INTERVAL="environment_sensor_poll_interval"
+DEFAULT_ENVIRONMENT_SENSOR_POLL_INTERVAL=30
+CONF_CONTROLLER_POLL_INTERVAL="controller_poll_interval"
+DEFAULT_CONTROLLER_POLL_INTERVAL=300
+CONF_SENSOR_POLL_INTERVAL="sensor_poll_interval"
+DEFAULT_SENSOR_POLL_INTERVAL=30
+CONF_PUSH_ONLY="push_only"
+DEFAULT_PUSH_ONLY=True
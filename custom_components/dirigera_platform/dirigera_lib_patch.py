@@ -1,22 +1,546 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from typing import Any, Optional, Dict
 
 from dirigera import Hub
 
 from dirigera.devices.device import Attributes, Device
+from dirigera.devices.light import Light, dict_to_light
+from dirigera.devices.blinds import Blind, dict_to_blind
+from dirigera.devices.outlet import Outlet, dict_to_outlet
+from dirigera.devices.air_purifier import AirPurifier, dict_to_air_purifier
+from dirigera.devices.environment_sensor import EnvironmentSensor, dict_to_environment_sensor
+from dirigera.devices.motion_sensor import MotionSensor, dict_to_motion_sensor
+from dirigera.devices.open_close_sensor import OpenCloseSensor, dict_to_open_close_sensor
+from dirigera.devices.water_sensor import WaterSensor, dict_to_water_sensor
 from dirigera.hub.abstract_smart_home_hub import AbstractSmartHomeHub
 from dirigera.devices.scene import Info, Icon,  SceneType, Trigger, TriggerDetails, ControllerType
+from enum import Enum
+import aiohttp
+import asyncio
+import contextlib
+import contextvars
 import logging 
+import requests
+import time
+
+from .hub_transport import hub_transport, pool_stats, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .hub_batcher import command_batcher
+from .hub_scheduler import RequestPriority, request_scheduler
+from .hub_reads import single_flight, read_batcher
+from .hub_metrics import hub_metrics, describe_error, route_key
+from .hub_executor import hub_executor
+from .hub_journal import command_journal
+from .hub_command_queue import device_command_queue
+from .hub_decode import device_decoder
+from .hub_resilience import (
+    IDEMPOTENT_METHODS,
+    RETRY_ATTEMPTS,
+    BREAKER_PROBE_ROUTE,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_BUDGET,
+    HubUnavailableError,
+    circuit_breaker,
+    is_transient_error,
+    is_hedged_route,
+    backoff_delay
+)
+from .hub_event_listener import to_snake_case
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
+# Requests made by the code in a HubX.count_requests() block
+class request_counter:
+    def __init__(self) -> None:
+        self.count = 0
+
+# Set by count_requests(), the tasks started in the block share its counter
+_scoped_request_counter : contextvars.ContextVar = contextvars.ContextVar("dirigera_platform_request_counter", default=None)
+
+def count_scoped_request() -> None:
+    counter = _scoped_request_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+def wire_value(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+# Attributes the set_xxx() of the dirigera devices check the device can receive
+CHECKED_CAPABILITIES = ["isOn", "lightLevel", "colorTemperature", "colorHue", "colorSaturation", "blindsTargetLevel", "childLock", "customName"]
+
+def check_attributes(device: Device, attributes: Dict[str, Any]) -> None:
+    # Same guards as the set_xxx() of the dirigera devices, raised before
+    # anything is sent
+    for key in attributes.keys():
+        if key in CHECKED_CAPABILITIES and key not in device.capabilities.can_receive:
+            raise AssertionError(f"This device does not support {key}")
+
+    if "lightLevel" in attributes:
+        if attributes["lightLevel"] < 1 or attributes["lightLevel"] > 100:
+            raise ValueError("light_level must be a value between 1 and 100")
+    if "colorTemperature" in attributes:
+        # The kelvin of colorTemperatureMax is the lower one
+        ct_low = device.attributes.color_temperature_max
+        ct_high = device.attributes.color_temperature_min
+        if ct_low is None or ct_high is None:
+            raise ValueError("Values of color_temp_max or color_temp_min are None")
+        if attributes["colorTemperature"] < ct_low or attributes["colorTemperature"] > ct_high:
+            raise ValueError(f"color_temperature must be a value between {ct_low} and {ct_high}")
+    if "colorHue" in attributes:
+        if attributes["colorHue"] < 0 or attributes["colorHue"] > 360:
+            raise ValueError("hue must be a value between 0 and 360")
+    if "colorSaturation" in attributes:
+        if attributes["colorSaturation"] < 0.0 or attributes["colorSaturation"] > 1.0:
+            raise ValueError("saturation must be a value between 0.0 and 1.0")
+    if "motorState" in attributes:
+        if attributes["motorState"] < 0 or attributes["motorState"] > 50:
+            raise ValueError("Motor state must be a value between 0 and 50")
+    if "blindsTargetLevel" in attributes:
+        if attributes["blindsTargetLevel"] < 0 or attributes["blindsTargetLevel"] > 100:
+            raise AssertionError("target_level must be a value between 0 and 100")
+
 # Patch to fix issues with motion sensor
 class HubX(Hub):
     def __init__(
-        self, token: str, ip_address: str, port: str = "8443", api_version: str = "v1"
+        self, token: str, ip_address: str, port: str = "8443", api_version: str = "v1",
+        session: aiohttp.ClientSession = None, session_stats: pool_stats = None,
+        command_batch_window: int = 0, rate_limit: float = 0, read_batch_threshold: int = 0, executor_workers: int = 2,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+        offline_command_ttl: int = 0, elide_commands: bool = False
     ) -> None:
         super().__init__(token, ip_address, port, api_version)
+        # Number of HTTP requests made to the hub
+        self.request_count = 0
+        # Latency/errors per route and executor queue time, see dump_stats
+        self._metrics = hub_metrics()
+        # Native asyncio transport, the async_xxx methods below go through this
+        # instead of holding an executor thread for the blocking calls. Uses the
+        # session passed in (with the pool_stats of its trace config) if any
+        self._transport = hub_transport(token, self.api_base_url, session, session_stats, connect_timeout, read_timeout)
+        self._timeout = (connect_timeout, read_timeout)
+        # Keep-alive pool for the blocking calls, dirigera.Hub uses requests.get()
+        # etc. which opens (and TLS handshakes) a new connection every call
+        self._requests_session = requests.Session()
+        # Worker threads the blocking calls run on
+        self._executor = hub_executor(executor_workers, self._metrics.record_executor_queue)
+        # Optional window (ms) in which device commands are collected and sent together
+        self._batcher = None
+        if command_batch_window > 0:
+            self._batcher = command_batcher(self._async_patch_now, command_batch_window)
+        # Commands of a device are sent one at a time, the latest value wins
+        self._command_queue = device_command_queue(self._async_send_patch)
+        # Orders the async requests by priority, keeps them within rate_limit requests/second
+        # and adapts the number of them in flight to how the hub copes
+        self._scheduler = request_scheduler(rate_limit)
+        # Fails the requests fast while the hub is down, see hub_resilience
+        self._breaker = circuit_breaker(lambda: self._transport.request("GET", BREAKER_PROBE_ROUTE))
+        self.retries = 0
+        # Commands that would not change the state of the device are not sent
+        self.elide_commands = elide_commands
+        self.elided_commands = 0
+        self.hedge_candidates = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.hedges_lost = 0
+        self.hedges_failed = 0
+        # Concurrent reads of a device share one request
+        self._device_reads = single_flight()
+        # Merges poll responses into the device models held
+        self._decoder = device_decoder()
+        # Optional number of pending device reads answered by one /devices fetch
+        self._read_batcher = None
+        if read_batch_threshold > 0:
+            self._read_batcher = read_batcher(
+                                    lambda id_: self.async_get(f"/devices/{id_}"),
+                                    lambda: self.async_get("/devices"),
+                                    read_batch_threshold)
+        # Optional journal of the device commands given while the hub is down,
+        # replayed once it is back unless older than offline_command_ttl seconds
+        self._journal = None
+        self._replay_task = None
+        if offline_command_ttl > 0:
+            self._journal = command_journal(offline_command_ttl)
+            self._breaker.add_listener(self._on_availability_changed)
+
+    @contextlib.contextmanager
+    def count_requests(self):
+        # Counts only the requests made by the code in the block, request_count
+        # also has the ones the entities make at the same time
+        counter = request_counter()
+        token = _scoped_request_counter.set(counter)
+        try:
+            yield counter
+        finally:
+            _scoped_request_counter.reset(token)
+
+    def _request(self, method: str, route: str, data: Any = None) -> requests.Response:
+        self.request_count += 1
+        count_scoped_request()
+        started_at = time.monotonic()
+        error = None
+        try:
+            response = self._requests_session.request(method, f"{self.api_base_url}{route}", headers=self.headers(), json=data, timeout=self._timeout, verify=False)
+            if not response.ok:
+                error = f"http_{response.status_code}"
+            return response
+        except Exception as ex:
+            error = describe_error(ex)
+            raise ex
+        finally:
+            self._metrics.record(method, route, time.monotonic() - started_at, error)
+
+    def get(self, route: str) -> Any:
+        response = self._request("GET", route)
+        response.raise_for_status()
+        return response.json()
+
+    def patch(self, route: str, data: List[Dict[str, Any]]) -> Any:
+        response = self._request("PATCH", route, data)
+        response.raise_for_status()
+        return response.text
+
+    def post(self, route: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        response = self._request("POST", route, data)
+        if not response.ok:
+            logger.debug(f"POST {route} failed with {response.status_code} : {response.text}")
+        response.raise_for_status()
+        if len(response.content) == 0:
+            return None
+        return response.json()
+
+    def delete(self, route: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        response = self._request("DELETE", route, data)
+        response.raise_for_status()
+        if len(response.content) == 0:
+            return None
+        return response.json()
+
+    async def _async_request(self, method: str, route: str, data: Any = None, priority: RequestPriority = None) -> Any:
+        if priority is None:
+            # Reads are polls, anything else is a command
+            priority = RequestPriority.BACKGROUND if method == "GET" else RequestPriority.INTERACTIVE
+        self._breaker.check()
+        attempt = 0
+        while True:
+            try:
+                if method == "GET" and is_hedged_route(route):
+                    result = await self._async_send_hedged(route, priority)
+                else:
+                    result = await self._async_send(method, route, data, priority)
+            except Exception as ex:
+                if not is_transient_error(ex):
+                    # The hub answered, it is up
+                    self._breaker.record_success()
+                    raise ex
+                
+                self._breaker.record_failure()
+                attempt += 1
+                if method not in IDEMPOTENT_METHODS or attempt >= RETRY_ATTEMPTS or self._breaker.is_open:
+                    raise ex
+                
+                logger.debug(f"{method} {route} failed with {ex}, retry {attempt} of {RETRY_ATTEMPTS - 1}...")
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt - 1))
+                continue
+            
+            self._breaker.record_success()
+            return result
+
+    async def _async_send(self, method: str, route: str, data: Any, priority: RequestPriority) -> Any:
+        await self._scheduler.acquire(priority)
+        self.request_count += 1
+        count_scoped_request()
+        started_at = time.monotonic()
+        try:
+            result = await self._transport.request(method, route, data)
+        except asyncio.CancelledError:
+            self._scheduler.release()
+            raise
+        except Exception as ex:
+            elapsed = time.monotonic() - started_at
+            self._scheduler.release(route_key(method, route), elapsed, is_transient_error(ex))
+            self._metrics.record(method, route, elapsed, describe_error(ex))
+            raise ex
+        
+        elapsed = time.monotonic() - started_at
+        self._scheduler.release(route_key(method, route), elapsed)
+        self._metrics.record(method, route, elapsed)
+        return result
+
+    async def _async_send_hedged(self, route: str, priority: RequestPriority) -> Any:
+        latency = self._metrics.route("GET", route).latency
+        self.hedge_candidates += 1
+        if latency.count < HEDGE_MIN_SAMPLES or self.hedges >= HEDGE_BUDGET * self.hedge_candidates:
+            return await self._async_send("GET", route, None, priority)
+        
+        first = asyncio.ensure_future(self._async_send("GET", route, None, priority))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=latency.percentile(0.95) / 1000)
+            if first in done:
+                return first.result()
+            
+            logger.debug(f"GET {route} slower than p95, sending it again...")
+            self.hedges += 1
+            second = asyncio.ensure_future(self._async_send("GET", route, None, priority))
+            pending = {first, second}
+            error = None
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            self.hedges_won += 1
+                        else:
+                            self.hedges_lost += 1
+                        return future.result()
+                    error = future.exception()
+            # Neither answered, it is neither won nor lost
+            self.hedges_failed += 1
+            raise error
+        finally:
+            # The loser (or both when the caller went away) is not needed anymore
+            for future in pending:
+                future.cancel()
+
+    async def async_run_in_executor(self, target, *args) -> Any:
+        # Runs one of the blocking calls on the hub's own workers, the wait for a
+        # worker is recorded apart from the time on the wire
+        return await self._executor.run(target, *args)
+
+    @property
+    def is_available(self) -> bool:
+        return not self._breaker.is_open
+
+    def add_availability_listener(self, listener) -> None:
+        self._breaker.add_listener(listener)
+
+    def stats(self) -> Dict[str, Any]:
+        blocking_connections = 0
+        blocking_requests = 0
+        for adapter in self._requests_session.adapters.values():
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                blocking_connections += pool.num_connections
+                blocking_requests += pool.num_requests
+
+        return {
+            "requests"  : self.request_count,
+            "async_pool": self._transport.stats(),
+            "command_queue" : self._command_queue.stats(),
+            "elided_commands" : self.elided_commands,
+            "command_batching" : self._batcher.stats() if self._batcher is not None else None,
+            "scheduler" : self._scheduler.stats(),
+            "retries" : self.retries,
+            "hedging" : {
+                "hedged"    : self.hedges,
+                "won"       : self.hedges_won,
+                "lost"      : self.hedges_lost,
+                "failed"    : self.hedges_failed
+            },
+            "circuit_breaker" : self._breaker.stats(),
+            "device_reads" : self._device_reads.stats(),
+            "read_batching" : self._read_batcher.stats() if self._read_batcher is not None else None,
+            "decoding" : self._decoder.stats(),
+            "latency" : self._metrics.stats(),
+            "command_journal" : self._journal.stats() if self._journal is not None else None,
+            "executor" : self._executor.stats(),
+            "blocking_pool" : {
+                "connections_created"   : blocking_connections,
+                "requests"              : blocking_requests,
+                "reuse_ratio"           : round(1 - blocking_connections / blocking_requests, 3) if blocking_requests > 0 else 0.0
+            }
+        }
+
+    async def async_close(self) -> None:
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+        await self._breaker.async_close()
+        await self._transport.async_close()
+        self._executor.shutdown()
+        self._requests_session.close()
+
+    async def async_get(self, route: str) -> Any:
+        return await self._async_request("GET", route)
+
+    async def async_patch(self, route: str, data: List[Dict[str, Any]]) -> Any:
+        result, _ = await self._async_patch(route, data)
+        return result
+
+    async def _async_patch(self, route: str, data: List[Dict[str, Any]]) -> Tuple[Any, bool]:
+        # The result and whether the hub took the command, False when it was
+        # only journaled to be sent once the hub is back
+        attributes = command_journal.attributes_of(data)
+        if self._journal is not None and attributes is not None:
+            # Older values of these are not to be replayed over this one
+            self._journal.discard(route, list(attributes.keys()))
+        try:
+            if attributes is not None:
+                result = await self._command_queue.submit(route, attributes)
+            else:
+                result = await self._async_send_patch(route, data)
+        except (HubUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            if self._journal is None or attributes is None or not (isinstance(ex, HubUnavailableError) or is_transient_error(ex)):
+                raise ex
+            logger.info(f"Hub unreachable, {list(attributes.keys())} of {route} will be sent once it is back...")
+            self._journal.add(route, attributes)
+            return None, False
+        
+        # The hub took a command, anything left over from a blip can go too
+        if self._journal is not None and len(self._journal) > 0:
+            self._schedule_replay()
+        return result, True
+
+    async def _async_send_patch(self, route: str, data: List[Dict[str, Any]]) -> Any:
+        if self._batcher is not None:
+            return await self._batcher.submit(route, data)
+        return await self._async_patch_now(route, data)
+
+    def _on_availability_changed(self, is_available: bool) -> None:
+        if is_available:
+            self._schedule_replay()
+
+    def _schedule_replay(self) -> None:
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.get_running_loop().create_task(self._async_replay_journal())
+
+    async def _async_replay_journal(self) -> None:
+        routes = self._journal.routes()
+        if len(routes) == 0:
+            return
+        
+        logger.info(f"Hub is back, replaying the commands of {len(routes)} devices...")
+        for route in routes:
+            # Taken right as it is queued behind the commands of the device, a
+            # command given since has already discarded what it replaces
+            attributes, queued_at = self._journal.take(route)
+            if len(attributes) == 0:
+                continue
+            try:
+                await self._command_queue.submit(route, attributes)
+                self._journal.record_replay(len(attributes), queued_at)
+            except (HubUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                if isinstance(ex, HubUnavailableError) or is_transient_error(ex):
+                    # Down again, keep it for the next time
+                    self._journal.add(route, attributes, queued_at)
+                else:
+                    logger.error(f"error encountered replaying {attributes} of {route}")
+                    logger.error(ex)
+
+    async def _async_patch_now(self, route: str, data: List[Dict[str, Any]]) -> Any:
+        return await self._async_request("PATCH", route, data)
+
+    async def async_post(self, route: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._async_request("POST", route, data)
+
+    async def async_delete(self, route: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._async_request("DELETE", route, data)
+
+    async def _async_read_device(self, id_: str) -> Dict:
+        if self._read_batcher is not None:
+            return await self._read_batcher.read(id_)
+        return await self.async_get(f"/devices/{id_}")
+
+    async def _async_get_device_data_by_id(self, id_: str, type_key: str, type_value: str) -> Dict:
+        try:
+            device_data = await self._device_reads.run(id_, lambda: self._async_read_device(id_))
+        except aiohttp.ClientResponseError as err:
+            if err.status == 404:
+                raise ValueError("Device id not found") from err
+            raise err
+        
+        if device_data[type_key] != type_value:
+            raise ValueError(f"Device is not a {type_value}")
+        return device_data
+
+    async def _async_get_device(self, id_: str, type_key: str, type_value: str, dict_to_fx, current: Device = None) -> Device:
+        # When the device model is passed the response is merged into it, else
+        # (or when the response does not fit it) a new model is validated
+        device_data = await self._async_get_device_data_by_id(id_, type_key, type_value)
+        device, _ = self.decode_device(device_data, dict_to_fx, current)
+        return device
+
+    def decode_device(self, device_data: Dict[str, Any], dict_to_fx, current: Device = None) -> Tuple[Device, bool]:
+        # The device model for a response and whether it differs from current
+        if current is not None:
+            changes = self._decoder.merge_changes(current, device_data)
+            if changes is not None:
+                return current, changes > 0
+        device = dict_to_fx(device_data, self)
+        self._decoder.remember(device_data)
+        return device, True
+
+    def is_unchanged_device_data(self, device_data: Dict[str, Any]) -> bool:
+        return self._decoder.is_unchanged(device_data)
+
+    def remember_device_data(self, device_data: Dict[str, Any]) -> None:
+        # Response the device model was built from at discovery
+        self._decoder.remember(device_data)
+
+    # async versions of the Hub.get_xxx_by_id(), same checks on type/deviceType.
+    # Pass the device model held to have the response merged into it
+    async def async_get_light_by_id(self, id_: str, current: Light = None) -> Light:
+        return await self._async_get_device(id_, "type", "light", dict_to_light, current)
+
+    async def async_get_blinds_by_id(self, id_: str, current: Blind = None) -> Blind:
+        return await self._async_get_device(id_, "deviceType", "blinds", dict_to_blind, current)
+
+    async def async_get_outlet_by_id(self, id_: str, current: Outlet = None) -> Outlet:
+        return await self._async_get_device(id_, "type", "outlet", dict_to_outlet, current)
+
+    async def async_get_air_purifier_by_id(self, id_: str, current: AirPurifier = None) -> AirPurifier:
+        return await self._async_get_device(id_, "deviceType", "airPurifier", dict_to_air_purifier, current)
+
+    async def async_get_environment_sensor_by_id(self, id_: str, current: EnvironmentSensor = None) -> EnvironmentSensor:
+        return await self._async_get_device(id_, "deviceType", "environmentSensor", dict_to_environment_sensor, current)
+
+    async def async_get_motion_sensor_by_id(self, id_: str, current: MotionSensor = None) -> MotionSensor:
+        return await self._async_get_device(id_, "deviceType", "motionSensor", dict_to_motion_sensor, current)
+
+    async def async_get_open_close_by_id(self, id_: str, current: OpenCloseSensor = None) -> OpenCloseSensor:
+        return await self._async_get_device(id_, "deviceType", "openCloseSensor", dict_to_open_close_sensor, current)
+
+    async def async_get_water_sensor_by_id(self, id_: str, current: WaterSensor = None) -> WaterSensor:
+        return await self._async_get_device(id_, "deviceType", "waterSensor", dict_to_water_sensor, current)
+
+    async def async_get_controller_by_id(self, id_: str, current: ControllerX = None) -> ControllerX:
+        return await self._async_get_device(id_, "type", "controller", dict_to_controller, current)
+
+    async def async_get_scene_by_id(self, scene_id: str) -> HackScene:
+        return HackScene.make_scene(self, await self.async_get(f"/scenes/{scene_id}"))
+
+    def skip_unchanged(self, devices: List[Device], attributes: Dict[str, Any]) -> bool:
+        # True (and counted) when every device already has the attributes asked
+        # for, the command would not change anything
+        if not self.elide_commands:
+            return False
+        for device in devices:
+            for key, value in attributes.items():
+                if wire_value(getattr(device.attributes, to_snake_case(key), None)) != wire_value(value):
+                    return False
+        logger.debug(f"Skipping {attributes} of {[device.id for device in devices]} as nothing would change")
+        self.elided_commands += 1
+        return True
+
+    async def async_set_attributes(self, device: Device, attributes: Dict[str, Any], skip_unchanged: bool = True) -> bool:
+        # Same as the set_xxx() of the dirigera devices, PATCH the attributes and
+        # on success reflect them on the local device. Returns False when not sent
+        # as the device is already in that state or it was only journaled
+        check_attributes(device, attributes)
+        if skip_unchanged and self.skip_unchanged([device], attributes):
+            return False
+        data = [{"attributes" : { key : wire_value(value) for key, value in attributes.items() }}]
+        _, sent = await self._async_patch(f"/devices/{device.id}", data=data)
+        if not sent:
+            # Only journaled, the device takes the values from the hub once
+            # the command reaches it, an expired one never changes it
+            return False
+        for key, value in attributes.items():
+            setattr(device.attributes, to_snake_case(key), value)
+        return True
+
+    async def async_trigger_scene(self, scene_id: str) -> None:
+        await self._async_request("POST", f"/scenes/{scene_id}/trigger", priority=RequestPriority.SCENE)
 
     def get_controllers(self) -> List[ControllerX]:
         """
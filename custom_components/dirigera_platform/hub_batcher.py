@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Collects the device commands (PATCH) issued within a short window, e.g. an
+# automation turning off 30 lights, and sends them to the hub together. Commands
+# with the same route and payload are sent once, the rest are sent concurrently
+# over the pooled connections. Every caller gets the result of its own command
+class command_batcher:
+    def __init__(self, send_fx: Callable[[str, Any], Awaitable[Any]], window_ms: int) -> None:
+        self._send_fx = send_fx
+        self._window = window_ms / 1000
+        self._pending = []
+        self._flush_handle = None
+
+        self.batches = 0
+        self.commands = 0
+        self.max_batch_size = 0
+        self.deduplicated = 0
+        self.latency_saved = 0.0
+
+    async def submit(self, route: str, data: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((route, data, future))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        pending = self._pending
+        self._pending = []
+        self._flush_handle = None
+        asyncio.get_running_loop().create_task(self._send_batch(pending))
+
+    async def _send_batch(self, pending) -> None:
+        groups = {}
+        for route, data, future in pending:
+            key = (route, json.dumps(data, sort_keys=True))
+            if key not in groups:
+                groups[key] = (route, data, [])
+            groups[key][2].append(future)
+
+        self.batches += 1
+        self.commands += len(pending)
+        self.max_batch_size = max(self.max_batch_size, len(pending))
+        self.deduplicated += len(pending) - len(groups)
+        logger.debug(f"Sending batch of {len(pending)} commands as {len(groups)} requests")
+
+        started_at = time.monotonic()
+        durations = await asyncio.gather(*[self._send_group(route, data, futures) for route, data, futures in groups.values()])
+        # Time the commands would have taken one after the other less what the batch took
+        self.latency_saved += max(0.0, sum(durations) - (time.monotonic() - started_at))
+
+    async def _send_group(self, route: str, data: Any, futures) -> float:
+        started_at = time.monotonic()
+        try:
+            result = await self._send_fx(route, data)
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+        except Exception as ex:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(ex)
+        return time.monotonic() - started_at
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches"               : self.batches,
+            "commands"              : self.commands,
+            "average_batch_size"    : round(self.commands / self.batches, 2) if self.batches > 0 else 0.0,
+            "max_batch_size"        : self.max_batch_size,
+            "deduplicated"          : self.deduplicated,
+            "latency_saved"         : round(self.latency_saved, 3)
+        }
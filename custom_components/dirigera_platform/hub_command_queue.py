@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+class device_commands:
+    def __init__(self) -> None:
+        self.in_flight = False
+        # Attributes waiting for the command in flight, newest value wins
+        self.pending : Dict[str, Any] = {}
+        self.waiters : List[asyncio.Future] = []
+
+# Sends the attribute commands of a device one at a time, in the order given.
+# Commands given while one is in flight wait and are merged, a newer value of
+# an attribute replaces the waiting one. Dragging a slider then sends the hub
+# the value in flight and the latest value, not every value in between
+class device_command_queue:
+    def __init__(self, send_fx: Callable[[str, Any], Awaitable[Any]]) -> None:
+        self._send_fx = send_fx
+        self._devices : Dict[str, device_commands] = {}
+
+        self.commands = 0
+        self.sent = 0
+        self.superseded = 0
+
+    async def submit(self, route: str, attributes: Dict[str, Any]) -> Any:
+        self.commands += 1
+        device = self._devices.get(route)
+        if device is None:
+            device = device_commands()
+            self._devices[route] = device
+
+        if not device.in_flight:
+            device.in_flight = True
+            try:
+                return await self._send(route, attributes)
+            finally:
+                self._send_next(route, device)
+
+        for key, value in attributes.items():
+            if key in device.pending:
+                self.superseded += 1
+            device.pending[key] = value
+        future = asyncio.get_running_loop().create_future()
+        device.waiters.append(future)
+        return await future
+
+    async def _send(self, route: str, attributes: Dict[str, Any]) -> Any:
+        self.sent += 1
+        return await self._send_fx(route, [{"attributes" : attributes}])
+
+    def _send_next(self, route: str, device: device_commands) -> None:
+        if len(device.pending) == 0:
+            device.in_flight = False
+            del self._devices[route]
+            return
+
+        attributes, waiters = device.pending, device.waiters
+        device.pending, device.waiters = {}, []
+        logger.debug(f"Sending latest {attributes} of {route} for {len(waiters)} commands")
+        asyncio.get_running_loop().create_task(self._send_waiting(route, device, attributes, waiters))
+
+    async def _send_waiting(self, route: str, device: device_commands, attributes: Dict[str, Any], waiters: List[asyncio.Future]) -> None:
+        try:
+            result = await self._send(route, attributes)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+        except Exception as ex:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(ex)
+        finally:
+            self._send_next(route, device)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "commands"      : self.commands,
+            "sent"          : self.sent,
+            "superseded"    : self.superseded
+        }
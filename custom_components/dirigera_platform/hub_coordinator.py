@@ -0,0 +1,134 @@
+import logging
+import random
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .ikea_gateway import HubDeviceType, is_pushed
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Each poll is moved by up to this share of the interval, so the polls of
+# several hubs (or restarts) do not line up into bursts at the hub
+POLL_JITTER = 0.1
+
+# Polls the hub for all the devices with one /devices on one schedule, instead
+# of every entity polling its own device. The poll is merged into the devices
+# held by the gateway and only the entities of the devices that changed are
+# updated.
+# While the event websocket is connected the device types it pushes changes
+# for only need the safety net poll, the others (and all of them while the
+# websocket is down) are polled at the interval of their type. In push only
+# mode types whose every entity shows pushed attributes only are not polled
+# at all while it is connected
+class hub_coordinator(DataUpdateCoordinator):
+    def __init__(self, hass: HomeAssistant, hub, platform, poll_intervals: Dict[HubDeviceType, int], safety_net_interval: int, push_only: bool) -> None:
+        self._hub = hub
+        self._platform = platform
+        self._poll_intervals = poll_intervals
+        self._safety_net_interval = safety_net_interval
+        self._push_only = push_only
+        self._changed : Set[str] = set()
+        self._unsub_listener = None
+        self._is_first_poll = True
+        self.push_connected = False
+        super().__init__(
+            hass,
+            logger,
+            name="dirigera_platform devices",
+            update_interval=None)
+
+        self.polls = 0
+        self.failed_polls = 0
+        self.devices_changed = 0
+        self.push_disconnects = 0
+
+    def start(self) -> None:
+        # The schedule only runs while there is a listener, the coordinator is
+        # its own listener and updates the entities of whatever changed
+        if self._unsub_listener is None:
+            self._unsub_listener = self.async_add_listener(self._update_changed_entities)
+
+    def poll_interval(self) -> Optional[int]:
+        # None when there is nothing to poll
+        interval = None
+        for device_type, type_interval in self._poll_intervals.items():
+            devices = self._platform.get_devices(device_type)
+            if len(devices) == 0:
+                continue
+            if self.push_connected and is_pushed(device_type):
+                if self._push_only and all(device.is_push_only for device in devices):
+                    continue
+                type_interval = self._safety_net_interval
+            interval = type_interval if interval is None else min(interval, type_interval)
+        return interval
+
+    @callback
+    def on_push_connection_changed(self, is_connected: bool) -> None:
+        self.push_connected = is_connected
+        if is_connected:
+            # Back to the safety net, from the next poll on
+            self._schedule_refresh()
+            return
+
+        # Changes may have been missed while it dropped, catch up now
+        logger.debug("Hub event listener disconnected, polling devices at the interval of their type...")
+        self.push_disconnects += 1
+        self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def _schedule_refresh(self) -> None:
+        interval = self.poll_interval()
+        if interval is None:
+            logger.debug("Every device is kept up to date by the hub event listener, not polling...")
+            self._async_unsub_refresh()
+            self.update_interval = None
+            return
+
+        if self._is_first_poll:
+            # Anywhere in the first interval, the devices were just fetched
+            self._is_first_poll = False
+            interval *= random.uniform(POLL_JITTER, 1)
+        else:
+            interval *= random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        self.update_interval = timedelta(seconds=interval)
+        super()._schedule_refresh()
+
+    async def async_shutdown(self) -> None:
+        if self._unsub_listener is not None:
+            self._unsub_listener()
+            self._unsub_listener = None
+        await super().async_shutdown()
+
+    async def _async_update_data(self) -> List[Dict[str, Any]]:
+        self.polls += 1
+        try:
+            devices_json = await self._hub.async_get("/devices")
+        except Exception as ex:
+            # Logged by the coordinator, once till a poll succeeds again
+            self.failed_polls += 1
+            raise UpdateFailed(ex) from ex
+
+        self._changed = self._platform.apply_devices_snapshot(self._hub, devices_json)
+        self.devices_changed += len(self._changed)
+        logger.debug(f"Poll of {len(devices_json)} devices changed {len(self._changed)} of them")
+        return devices_json
+
+    @callback
+    def _update_changed_entities(self) -> None:
+        changed, self._changed = self._changed, set()
+        if len(changed) > 0:
+            self._platform.update_entities(changed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "poll_interval"     : self.poll_interval(),
+            "jittered_interval" : round(self.update_interval.total_seconds(), 1) if self.update_interval is not None else None,
+            "push_connected"    : self.push_connected,
+            "push_disconnects"  : self.push_disconnects,
+            "polls"             : self.polls,
+            "failed_polls"      : self.failed_polls,
+            "devices_changed"   : self.devices_changed
+        }
@@ -0,0 +1,128 @@
+import datetime
+import logging
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+class schema_changed(Exception):
+    pass
+
+# hub (camelCase) name -> field name of a model class
+_field_names : Dict[type, Dict[str, str]] = {}
+
+def field_names(model_class: type) -> Dict[str, str]:
+    names = _field_names.get(model_class)
+    if names is None:
+        names = { (field.alias or name) : name for name, field in model_class.model_fields.items() }
+        _field_names[model_class] = names
+    return names
+
+def convert(current: Any, value: Any) -> Any:
+    # The new value in the type of the current one, for the types the hub sends
+    # as plain JSON values. Anything else needs the model to validate it
+    if isinstance(current, Enum):
+        try:
+            return type(current)(value)
+        except ValueError as ex:
+            raise schema_changed(ex)
+    if isinstance(current, bool):
+        if isinstance(value, bool):
+            return value
+    elif isinstance(current, int):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    elif isinstance(current, float):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    elif isinstance(current, str):
+        if isinstance(value, str):
+            return value
+    elif isinstance(current, datetime.datetime):
+        if isinstance(value, str):
+            try:
+                return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError as ex:
+                raise schema_changed(ex)
+    raise schema_changed(f"Can not take {value} in place of {current}")
+
+def is_plain(value: Any) -> bool:
+    return value is None or isinstance(value, (bool, int, float, str, Enum))
+
+# Merges a poll response into the device model already held instead of building
+# (and validating) a new model every poll. Values that can be compared as is
+# are compared with the model, the rest with the response last merged. Only the
+# values that changed are converted and set. Whatever does not fit, e.g. a new
+# attribute or a value of another type, raises schema_changed and the caller
+# validates the full model as done at discovery
+class device_decoder:
+    def __init__(self) -> None:
+        # Last response merged or validated per device id
+        self._responses : Dict[str, Dict[str, Any]] = {}
+        self.merges = 0
+        self.full_decodes = 0
+        self.schema_changes = 0
+
+    def remember(self, device_data: Dict[str, Any]) -> None:
+        self.full_decodes += 1
+        self._responses[device_data["id"]] = device_data
+
+    def is_unchanged(self, device_data: Dict[str, Any]) -> bool:
+        # Same response as the one last merged, nothing to look at
+        return self._responses.get(device_data["id"]) == device_data
+
+    def merge_changes(self, device: BaseModel, device_data: Dict[str, Any]) -> Optional[int]:
+        # Number of values changed on the model, None when it could not be merged
+        previous = self._responses.get(device.id)
+        if previous is None:
+            return None
+
+        try:
+            changes = []
+            self._diff(device, device_data, previous, changes)
+        except schema_changed as ex:
+            logger.debug(f"Response of {device.id} does not fit its model ({ex}), validating it in full...")
+            self.schema_changes += 1
+            return None
+
+        # Only applied once all of it is known to fit
+        for model, name, value in changes:
+            setattr(model, name, value)
+        self._responses[device.id] = device_data
+        self.merges += 1
+        return len(changes)
+
+    def _diff(self, model: BaseModel, data: Dict[str, Any], previous: Optional[Dict[str, Any]], changes: list) -> None:
+        if previous is None or data.keys() != previous.keys():
+            raise schema_changed("Keys differ")
+
+        names = field_names(type(model))
+        for key, value in data.items():
+            name = names.get(key)
+            if name is None:
+                # Not part of the model, it is ignored on validation too
+                continue
+            current = getattr(model, name)
+
+            if key == "attributes":
+                self._diff(current, value, previous.get(key), changes)
+                continue
+
+            if is_plain(current):
+                if (current.value if isinstance(current, Enum) else current) == value:
+                    continue
+                if current is None or value is None:
+                    raise schema_changed(f"{key} is now {value}")
+            elif previous[key] == value:
+                continue
+
+            changes.append((model, name, convert(current, value)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "merges"            : self.merges,
+            "full_decodes"      : self.full_decodes,
+            "schema_changes"    : self.schema_changes
+        }
@@ -8,6 +8,7 @@ import ssl
 import re
 from typing import Any 
 import datetime
+from enum import Enum
 from dateutil import parser
 from dirigera import Hub 
 
@@ -30,16 +31,45 @@ process_events_from = {
     "light"           :     ["isOn", "lightLevel", "colorTemperature"],
     "openCloseSensor" :     ["isOpen","batteryPercentage"],
     "waterSensor"     :     ["waterLeakDetected","batteryPercentage"],
-    "blinds"          :     ["blindsCurrentLevel","batteryPercentage"],
+    "blinds"          :     ["blindsCurrentLevel","blindsTargetLevel","batteryPercentage"],
     "environmentSensor":    [   "currentTemperature",
                                 "currentRH",
                                 "currentPM25",
                                 "vocIndex",
-                                "batteryPercentage"]
+                                "batteryPercentage"],
+    "airPurifier"     :     [   "fanMode",
+                                "motorState",
+                                "motorRuntime",
+                                "currentPM25",
+                                "filterAlarmStatus",
+                                "filterElapsedTime",
+                                "filterLifetime",
+                                "childLock",
+                                "statusLight"],
+    # deviceType of controllers is the kind of remote e.g. lightController
+    "controller"      :     ["batteryPercentage", "customName"]
 }
 
+def event_device_type(device_type: str, type: str) -> str:
+    # The process_events_from entry of a device, by its deviceType unless only
+    # its type has one
+    if device_type not in process_events_from and type in process_events_from:
+        return type
+    return device_type
+
+def are_pushed(device_type: str, attributes: list) -> bool:
+    # Changes of every one of the (hub named) attributes come on the websocket
+    if attributes is None or device_type not in process_events_from:
+        return False
+    return all(attribute in process_events_from[device_type] for attribute in attributes)
+
 controller_trigger_last_time_map = {}
 
+# Pings the hub so a connection that silently died is noticed and polling
+# takes over, instead of waiting for the OS to time out the socket
+WEBSOCKET_PING_INTERVAL = 60
+WEBSOCKET_PING_TIMEOUT = 10
+
 def to_snake_case(name:str) -> str:
     return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
 
@@ -81,11 +111,40 @@ class hub_event_listener(threading.Thread):
             return None 
         return hub_event_listener.device_registry[id]
     
-    def __init__(self, hub : Hub, hass):
+    def __init__(self, hub : Hub, hass, scenes = None):
         super().__init__()
         self._hub : Hub = hub
         self._request_to_stop = False 
         self._hass = hass 
+        # scene_cache kept up to date from the scene events
+        self._scenes = scenes
+        self._connection_listeners = []
+        self.is_connected = False
+        self.disconnects = 0
+
+    def add_connection_listener(self, listener) -> None:
+        # Called on the event loop with True/False as the websocket connects/drops
+        self._connection_listeners.append(listener)
+
+    def set_connected(self, is_connected: bool) -> None:
+        if self.is_connected == is_connected:
+            return 
+        self.is_connected = is_connected
+        if not is_connected:
+            self.disconnects += 1
+        if self._request_to_stop:
+            return 
+        
+        logger.info(f"Hub event listener {'connected' if is_connected else 'disconnected'}...")
+        for listener in self._connection_listeners:
+            self._hass.loop.call_soon_threadsafe(listener, is_connected)
+
+    def on_open(self, ws:Any):
+        self.set_connected(True)
+
+    def on_close(self, ws:Any, close_status_code, close_msg):
+        logger.debug(f"on_close hub event listener {close_status_code} {close_msg}")
+        self.set_connected(False)
 
     def on_error(self, ws:Any, ws_msg:str):
         logger.debug(f"on_error hub event listener {ws_msg}")
@@ -205,6 +264,9 @@ class hub_event_listener(threading.Thread):
                 logger.debug(f"'type' not found in incoming message, discarding : {msg}")
                 return 
             
+            if msg['type'] in ["sceneCreated", "sceneUpdated", "sceneDeleted"] and self._scenes is not None:
+                self._hass.loop.call_soon_threadsafe(self._scenes.on_event, msg)
+
             if msg['type'] == "sceneUpdated":
                 logger.debug(f"Found sceneUpdated message... ")
                 return self.parse_scene_update(msg)
@@ -222,7 +284,7 @@ class hub_event_listener(threading.Thread):
 
             device_type = None
             if "deviceType" in info:
-                device_type = info["deviceType"]
+                device_type = event_device_type(info["deviceType"], info.get("type"))
             elif "type" in info:
                 device_type = info["type"]
             else:
@@ -278,6 +340,11 @@ class hub_event_listener(threading.Thread):
                                 #Ignore the exception
                                 logger.warning(f"Failed to convert {attributes[key]} to date/time...")
                         
+                        # Enums e.g. fanMode of air purifiers, set as the enum the model holds
+                        current_value = getattr(entity._json_data.attributes, key_attr, None)
+                        if isinstance(current_value, Enum):
+                            value_to_set = type(current_value)(value_to_set)
+                        
                         setattr(entity._json_data.attributes,key_attr, value_to_set)
                         logger.debug(f"Entity after setting: {entity._json_data}")
                     except Exception as ex:
@@ -292,6 +359,11 @@ class hub_event_listener(threading.Thread):
                     logger.debug("Ignoring calling update_ha_state as ignore_update is set")
                     return 
                 
+                # For devices working out more from what changed, e.g. blinds moving.
+                # Run on the event loop ahead of the state update scheduled next
+                if hasattr(entity, "on_attributes_pushed"):
+                    self._hass.loop.call_soon_threadsafe(entity.on_attributes_pushed, set(attributes.keys()))
+                
                 entity.schedule_update_ha_state(False)
                 
                 if registry_value.cascade_entity is not None:
@@ -312,8 +384,13 @@ class hub_event_listener(threading.Thread):
             self._wsapp = websocket.WebSocketApp(
                 self._hub.websocket_base_url,
                 header={"Authorization": f"Bearer {self._hub.token}"},
+                on_open=self.on_open,
+                on_close=self.on_close,
                 on_message=self.on_message)
-            self._wsapp.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+            self._wsapp.run_forever(
+                sslopt={"cert_reqs": ssl.CERT_NONE},
+                ping_interval=WEBSOCKET_PING_INTERVAL,
+                ping_timeout=WEBSOCKET_PING_TIMEOUT)
             #self._hub.create_event_listener(on_message=self.on_message, on_error=self.on_error)
         except Exception as ex:
             logger.error("Error creating event listener...")
@@ -337,6 +414,7 @@ class hub_event_listener(threading.Thread):
         while True:
             # Blocking call
             self.create_listener()
+            self.set_connected(False)
             logger.debug("Listener thread complete...")
             if self._request_to_stop:
                 break
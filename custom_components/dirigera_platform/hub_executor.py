@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Worker threads of its own for the blocking hub calls, so a burst of them does
+# not hold up the recorder & other integrations on the shared HASS executor and
+# the other way around
+class hub_executor:
+    def __init__(self, workers: int, on_queue_wait: Optional[Callable[[float], None]] = None) -> None:
+        self._workers = workers
+        self._on_queue_wait = on_queue_wait
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dirigera_platform")
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+        self.queued = 0
+        self.max_queued = 0
+        self.active = 0
+        self.jobs = 0
+        self.busy_time = 0.0
+
+    async def run(self, target: Callable[..., Any], *args) -> Any:
+        submitted_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def job():
+            started_at = time.monotonic()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            if self._on_queue_wait is not None:
+                self._on_queue_wait(started_at - submitted_at)
+            try:
+                return target(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.jobs += 1
+                    self.busy_time += time.monotonic() - started_at
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started_at
+        with self._lock:
+            return {
+                "workers"       : self._workers,
+                "active"        : self.active,
+                "queued"        : self.queued,
+                "max_queued"    : self.max_queued,
+                "jobs"          : self.jobs,
+                # Share of the worker time since start spent running jobs
+                "utilization"   : round(self.busy_time / (self._workers * elapsed), 4) if elapsed > 0 else 0.0
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
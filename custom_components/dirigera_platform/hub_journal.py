@@ -0,0 +1,103 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .hub_metrics import latency_histogram
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Most device attributes kept while the hub is down, the oldest go first
+JOURNAL_MAX_SIZE = 100
+
+# Device commands (attribute PATCHes) that could not be sent as the hub was
+# down. Only the last value per device and attribute is kept and values older
+# than ttl seconds are dropped, so a command is never applied long after it
+# was given. A value given again later replaces the one journaled
+class command_journal:
+    def __init__(self, ttl: int, max_size: int = JOURNAL_MAX_SIZE) -> None:
+        self._ttl = ttl
+        self._max_size = max_size
+        # (route, attribute) -> (value, queued_at)
+        self._entries : OrderedDict[Tuple[str, str], Tuple[Any, float]] = OrderedDict()
+        self.replay_latency = latency_histogram()
+
+        self.journaled = 0
+        self.replayed = 0
+        self.expired = 0
+        self.dropped = 0
+        self.superseded = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def attributes_of(data: Any) -> Optional[Dict[str, Any]]:
+        # Only PATCHes made up of attributes can be collapsed
+        if not isinstance(data, list) or not all(isinstance(item, dict) and list(item.keys()) == ["attributes"] for item in data):
+            return None
+        attributes = {}
+        for item in data:
+            attributes.update(item["attributes"])
+        return attributes
+
+    def add(self, route: str, attributes: Dict[str, Any], queued_at: Optional[float] = None) -> None:
+        # queued_at is passed when a replay failed, the ttl still runs from the
+        # time the command was given
+        is_replay = queued_at is not None
+        if not is_replay:
+            queued_at = time.monotonic()
+            self.journaled += len(attributes)
+        for key, value in attributes.items():
+            if is_replay and (route, key) in self._entries:
+                # Journaled again while it was being replayed, that one is newer
+                continue
+            # Re-inserted at the end, it is now the newest
+            self._entries.pop((route, key), None)
+            self._entries[(route, key)] = (value, queued_at)
+
+        while len(self._entries) > self._max_size:
+            (dropped_route, dropped_key), _ = self._entries.popitem(last=False)
+            logger.debug(f"Command journal full, dropping {dropped_key} of {dropped_route}")
+            self.dropped += 1
+
+    def discard(self, route: str, keys: List[str]) -> None:
+        # A newer value of these is on its way to the hub
+        for key in keys:
+            if self._entries.pop((route, key), None) is not None:
+                self.superseded += 1
+
+    def routes(self) -> List[str]:
+        return list(dict.fromkeys(route for route, _ in self._entries.keys()))
+
+    def take(self, route: str) -> Tuple[Dict[str, Any], float]:
+        # The attributes of route still fresh enough, with when the oldest of
+        # them was queued. They are removed from the journal
+        now = time.monotonic()
+        attributes = {}
+        oldest = now
+        for (entry_route, key) in [entry for entry in self._entries.keys() if entry[0] == route]:
+            value, queued_at = self._entries.pop((entry_route, key))
+            if now - queued_at > self._ttl:
+                self.expired += 1
+                continue
+            attributes[key] = value
+            oldest = min(oldest, queued_at)
+        return attributes, oldest
+
+    def record_replay(self, attribute_count: int, queued_at: float) -> None:
+        self.replayed += attribute_count
+        self.replay_latency.record(time.monotonic() - queued_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl"               : self._ttl,
+            "queued"            : len(self._entries),
+            "max_size"          : self._max_size,
+            "journaled"         : self.journaled,
+            "replayed"          : self.replayed,
+            "expired"           : self.expired,
+            "dropped"           : self.dropped,
+            "superseded"        : self.superseded,
+            "replay_latency"    : self.replay_latency.as_dict()
+        }
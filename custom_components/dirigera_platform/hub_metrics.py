@@ -0,0 +1,119 @@
+import bisect
+import functools
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Upper bounds (ms) of the latency buckets, the last bucket is everything above
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Path segments following these are ids
+ID_PARENT_SEGMENTS = ["devices", "scenes", "set"]
+
+@functools.lru_cache(maxsize=512)
+def route_template(route: str) -> str:
+    # /devices/1234_1 -> /devices/{id}, /devices/set/abcd -> /devices/set/{id}
+    # /scenes/abcd/trigger -> /scenes/{id}/trigger
+    segments = route.strip("/").split("/")
+    for index in range(1, len(segments)):
+        if segments[index - 1] in ID_PARENT_SEGMENTS and segments[index] != "set":
+            segments[index] = "{id}"
+    return "/" + "/".join(segments)
+
+def route_key(method: str, route: str) -> str:
+    # The kind of request, e.g. GET /devices/{id}
+    return f"{method} {route_template(route)}"
+
+def describe_error(ex: Exception) -> str:
+    status = getattr(ex, "status", None)
+    if status is not None:
+        return f"http_{status}"
+    return type(ex).__name__
+
+class latency_histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction: float) -> float:
+        # Upper bound of the bucket the percentile falls in, max for the last bucket
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(float(LATENCY_BUCKETS_MS[index]), self.max)
+                break
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count"         : self.count,
+            "average_ms"    : round(self.total / self.count, 1) if self.count > 0 else 0.0,
+            "p50_ms"        : round(self.percentile(0.5), 1),
+            "p95_ms"        : round(self.percentile(0.95), 1),
+            "max_ms"        : round(self.max, 1),
+            "histogram"     : self.counts
+        }
+
+class route_metrics:
+    def __init__(self) -> None:
+        self.latency = latency_histogram()
+        self.errors : Dict[str, int] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        metrics = self.latency.as_dict()
+        metrics["errors"] = dict(self.errors)
+        return metrics
+
+# Time on the wire per method and route template, and separately the time the
+# blocking calls waited for an executor thread before going on the wire.
+# Recorded from the executor threads as well as the event loop, hence the lock
+class hub_metrics:
+    def __init__(self) -> None:
+        self.routes : Dict[str, route_metrics] = {}
+        self.executor_queue = latency_histogram()
+        self._lock = threading.Lock()
+
+    def route(self, method: str, route: str) -> route_metrics:
+        key = route_key(method, route)
+        with self._lock:
+            metrics = self.routes.get(key)
+            if metrics is None:
+                metrics = route_metrics()
+                self.routes[key] = metrics
+        return metrics
+
+    def record(self, method: str, route: str, seconds: float, error: Optional[str] = None) -> None:
+        metrics = self.route(method, route)
+        with self._lock:
+            metrics.latency.record(seconds)
+            if error is not None:
+                metrics.errors[error] = metrics.errors.get(error, 0) + 1
+
+    def record_executor_queue(self, seconds: float) -> None:
+        with self._lock:
+            self.executor_queue.record(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "buckets_ms"        : LATENCY_BUCKETS_MS,
+                "routes"            : { key : metrics.as_dict() for key, metrics in sorted(self.routes.items()) },
+                "executor_queue"    : self.executor_queue.as_dict()
+            }
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Concurrent reads of the same device share one request to the hub, e.g. the
+# six sensor entities of a Vindstyrka updating together. Every caller gets the
+# result (or exception) of the one request in flight
+class single_flight:
+    def __init__(self) -> None:
+        self._inflight : Dict[str, asyncio.Future] = {}
+        self.reads = 0
+        self.deduplicated = 0
+
+    async def run(self, key: str, read_fx: Callable[[], Awaitable[Any]]) -> Any:
+        self.reads += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(read_fx())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._on_done(key, done))
+        else:
+            self.deduplicated += 1
+            logger.debug(f"Read of {key} already in flight, sharing it...")
+        # A caller giving up must not cancel the read for the others
+        return await asyncio.shield(future)
+
+    def _on_done(self, key: str, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Retrieve it in case every caller went away
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reads"         : self.reads,
+            "deduplicated"  : self.deduplicated
+        }
+
+# Window in which the reads of different devices are collected
+READ_BATCH_WINDOW = 0.01
+
+# Collects the device reads issued within a short window, e.g. all the entities
+# of a platform polling together, and when there are at least threshold of them
+# answers them all from one /devices fetch instead of a request per device
+class read_batcher:
+    def __init__(
+        self, 
+        read_one_fx: Callable[[str], Awaitable[Any]], 
+        read_all_fx: Callable[[], Awaitable[Any]], 
+        threshold: int
+    ) -> None:
+        self._read_one_fx = read_one_fx
+        self._read_all_fx = read_all_fx
+        self._threshold = threshold
+        self._pending : Dict[str, asyncio.Future] = {}
+        self._flush_handle = None
+
+        self.batches = 0
+        self.batched_reads = 0
+        self.single_reads = 0
+
+    async def read(self, id_: str) -> Any:
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(id_)
+        if future is None:
+            future = loop.create_future()
+            self._pending[id_] = future
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(READ_BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        pending = self._pending
+        self._pending = {}
+        self._flush_handle = None
+        asyncio.get_running_loop().create_task(self._send(pending))
+
+    async def _send(self, pending: Dict[str, asyncio.Future]) -> None:
+        if len(pending) < self._threshold:
+            self.single_reads += len(pending)
+            await asyncio.gather(*[self._send_one(id_, future) for id_, future in pending.items()])
+            return
+
+        logger.debug(f"Answering {len(pending)} device reads from one /devices fetch")
+        self.batches += 1
+        self.batched_reads += len(pending)
+        try:
+            devices = { device["id"] : device for device in await self._read_all_fx() }
+        except Exception as ex:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        for id_, future in pending.items():
+            if future.done():
+                continue
+            if id_ in devices:
+                future.set_result(devices[id_])
+            else:
+                future.set_exception(ValueError("Device id not found"))
+
+    async def _send_one(self, id_: str, future: asyncio.Future) -> None:
+        try:
+            result = await self._read_one_fx(id_)
+            if not future.done():
+                future.set_result(result)
+        except Exception as ex:
+            if not future.done():
+                future.set_exception(ex)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold"     : self._threshold,
+            "batches"       : self.batches,
+            "batched_reads" : self.batched_reads,
+            "single_reads"  : self.single_reads
+        }
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, List
+
+import aiohttp
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Requests that can be sent again without changing the outcome, PATCH is included
+# as the hub is only ever sent absolute attribute values
+IDEMPOTENT_METHODS = ["GET", "PATCH", "DELETE"]
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_BASE = 0.25
+RETRY_BACKOFF_MAX = 2.0
+
+# A GET still not answered after the p95 latency of its route is sent a second
+# time and whichever answers first is used. Needs some samples to know the p95
+# and is kept to a share of the GETs so a slow hub is not sent even more
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET = 0.1
+# Only the small reads of one device are hedged, a second whole hub /devices
+# or /scenes would land on a hub that is already slow to build the first
+HEDGED_ROUTE_PREFIX = "/devices/"
+
+# Consecutive failed requests after which the hub is considered down
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_PROBE_INTERVAL = 30
+# Any answer from the hub, even a 404, tells the hub is back
+BREAKER_PROBE_ROUTE = "/hub/status"
+
+class HubUnavailableError(Exception):
+    pass
+
+def is_transient_error(ex: Exception) -> bool:
+    # Connection problems, timeouts and server side errors, anything else is an
+    # answer from the hub and would be the same if sent again
+    if isinstance(ex, aiohttp.ClientResponseError):
+        return ex.status >= 500
+    return isinstance(ex, (aiohttp.ClientError, asyncio.TimeoutError))
+
+def is_hedged_route(route: str) -> bool:
+    return route.startswith(HEDGED_ROUTE_PREFIX) and "/" not in route[len(HEDGED_ROUTE_PREFIX):]
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter so the entities retrying together do not hit the hub together
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+# Stops sending requests to a hub that is down, every call fails fast with
+# HubUnavailableError while open and the hub is probed in the background till
+# it answers again. Listeners are called with the new availability
+class circuit_breaker:
+    def __init__(self, probe_fx: Callable[[], Awaitable[Any]]) -> None:
+        self._probe_fx = probe_fx
+        self._listeners : List[Callable[[bool], None]] = []
+        self._consecutive_failures = 0
+        self._probe_task = None
+        self.is_open = False
+
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def add_listener(self, listener: Callable[[bool], None]) -> None:
+        self._listeners.append(listener)
+
+    def check(self) -> None:
+        if self.is_open:
+            self.rejected += 1
+            raise HubUnavailableError("Hub is unavailable, request not sent")
+
+    def record_success(self) -> None:
+        self._consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        if not self.is_open and self._consecutive_failures >= BREAKER_FAILURE_THRESHOLD:
+            self._open()
+
+    def _open(self) -> None:
+        logger.warning(f"Hub failed {self._consecutive_failures} requests in a row, marking it unavailable "
+                       f"and probing every {BREAKER_PROBE_INTERVAL} seconds...")
+        self.is_open = True
+        self.opened += 1
+        self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+        self._notify()
+
+    def _close(self) -> None:
+        logger.warning("Hub is reachable again...")
+        self.is_open = False
+        self._consecutive_failures = 0
+        self._probe_task = None
+        self._notify()
+
+    async def _probe(self) -> None:
+        while True:
+            await asyncio.sleep(BREAKER_PROBE_INTERVAL)
+            self.probes += 1
+            try:
+                await self._probe_fx()
+            except Exception as ex:
+                if is_transient_error(ex):
+                    logger.debug(f"Hub probe failed : {ex}")
+                    continue
+            self._close()
+            return
+
+    def _notify(self) -> None:
+        for listener in self._listeners:
+            try:
+                listener(not self.is_open)
+            except Exception as ex:
+                logger.error("error encountered notifying hub availability change")
+                logger.error(ex)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state"                 : "open" if self.is_open else "closed",
+            "consecutive_failures"  : self._consecutive_failures,
+            "opened"                : self.opened,
+            "rejected"              : self.rejected,
+            "probes"                : self.probes
+        }
+
+    async def async_close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
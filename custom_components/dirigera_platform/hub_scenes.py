@@ -0,0 +1,82 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from homeassistant.core import callback
+
+from .dirigera_lib_patch import HackScene
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# The scenes of a hub, loaded once with the device inventory and kept up to
+# date from the scene events on the websocket instead of polling every scene.
+# Listeners of a scene are called when it is updated or deleted
+class scene_cache:
+    def __init__(self, hub) -> None:
+        self._hub = hub
+        self._scenes : Dict[str, HackScene] = {}
+        self._listeners : Dict[str, List[Callable[[], None]]] = {}
+        self._created_listener : Optional[Callable[[HackScene], None]] = None
+
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+
+    def load(self, scenes_json: List[Dict[str, Any]]) -> List[HackScene]:
+        self._scenes = { scene.id : scene for scene in [HackScene.make_scene(self._hub, scene_json) for scene_json in scenes_json] }
+        return list(self._scenes.values())
+
+    def get(self, scene_id: str) -> Optional[HackScene]:
+        return self._scenes.get(scene_id)
+
+    def add_listener(self, scene_id: str, listener: Callable[[], None]) -> None:
+        self._listeners.setdefault(scene_id, []).append(listener)
+
+    def set_created_listener(self, listener: Callable[[HackScene], None]) -> None:
+        self._created_listener = listener
+
+    @callback
+    def on_event(self, msg: Dict[str, Any]) -> None:
+        # sceneCreated/sceneUpdated carry the scene, sceneDeleted at least its id
+        data = msg.get("data")
+        if data is None or "id" not in data:
+            logger.debug(f"discarding scene message without 'data/id': {msg}")
+            return
+        scene_id = data["id"]
+
+        if msg["type"] == "sceneDeleted":
+            if self._scenes.pop(scene_id, None) is not None:
+                logger.debug(f"Scene {scene_id} deleted on hub...")
+                self.deleted += 1
+                self._notify(scene_id)
+            return
+
+        try:
+            scene = HackScene.make_scene(self._hub, data)
+        except Exception as ex:
+            logger.debug(f"discarding scene message that could not be parsed: {msg}")
+            logger.debug(ex)
+            return
+
+        is_new = scene_id not in self._scenes
+        self._scenes[scene_id] = scene
+        if not is_new:
+            self.updated += 1
+            self._notify(scene_id)
+            return
+
+        logger.debug(f"Scene {scene.name} ({scene_id}) created on hub...")
+        self.created += 1
+        if self._created_listener is not None:
+            self._created_listener(scene)
+
+    def _notify(self, scene_id: str) -> None:
+        for listener in self._listeners.get(scene_id, []):
+            listener()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scenes"    : len(self._scenes),
+            "created"   : self.created,
+            "updated"   : self.updated,
+            "deleted"   : self.deleted
+        }
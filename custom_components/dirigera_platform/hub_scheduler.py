@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Dict, Optional
+
+from .hub_transport import POOL_CONNECTION_LIMIT
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Requests allowed in flight at start and the range the limit moves in
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = POOL_CONNECTION_LIMIT
+# Recent latency above this multiple of the usual latency means the hub is struggling
+LATENCY_TOLERANCE = 1.5
+# Latency differences below this (seconds) are noise
+LATENCY_NOISE = 0.05
+DECREASE_FACTOR = 0.5
+# Time after a decrease in which the results of requests already in flight are
+# not held against the new limit
+DECREASE_COOLDOWN = 1.0
+FAST_LATENCY_WEIGHT = 0.25
+SLOW_LATENCY_WEIGHT = 0.01
+
+class RequestPriority(IntEnum):
+    INTERACTIVE = 0     # Commands from the user/automations
+    SCENE       = 1     # Scene triggers
+    BACKGROUND  = 2     # Polls and other reads
+
+# Commands are already sent one at a time per device (and batched when set),
+# holding them to the rate limit only stalls a group or scene of many devices.
+# The adaptive limit of requests in flight still applies to them
+RATE_LIMIT_EXEMPT = [RequestPriority.INTERACTIVE]
+
+class priority_wait_stats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float) -> None:
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests"      : self.requests,
+            "average_wait"  : round(self.total_wait / self.requests, 4) if self.requests > 0 else 0.0,
+            "max_wait"      : round(self.max_wait, 4)
+        }
+
+# Latency of one kind of request, e.g. `GET /devices/{id}`, compared only with
+# itself so a naturally slow one (a whole hub /devices) does not read as the
+# hub slowing down
+class latency_baseline:
+    def __init__(self, latency: float) -> None:
+        # Recent average of the latency and the latency of an unloaded hub, the
+        # latter follows a new low right away and a rise only slowly
+        self.fast_latency = latency
+        self.slow_latency = latency
+
+    def record(self, latency: float) -> None:
+        self.fast_latency += FAST_LATENCY_WEIGHT * (latency - self.fast_latency)
+        self.slow_latency = min(latency, self.slow_latency + SLOW_LATENCY_WEIGHT * (latency - self.slow_latency))
+
+    @property
+    def is_rising(self) -> bool:
+        return self.fast_latency > max(self.slow_latency * LATENCY_TOLERANCE, self.slow_latency + LATENCY_NOISE)
+
+    @property
+    def trend(self) -> float:
+        # Above 1 latency is rising, below 1 it is falling
+        if self.slow_latency == 0:
+            return 1.0
+        return self.fast_latency / self.slow_latency
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ms"        : round(self.fast_latency * 1000, 1),
+            "usual_latency_ms"  : round(self.slow_latency * 1000, 1),
+            "latency_trend"     : round(self.trend, 2)
+        }
+
+# Number of requests allowed in flight, in the style of TCP congestion control
+# (AIMD). It grows by one per round of requests while latency stays close to
+# the usual latency of each kind of request and is halved on a transient error
+# or when the latency of a kind rises
+class adaptive_limit:
+    def __init__(self) -> None:
+        self.limit = float(INITIAL_CONCURRENCY)
+        self._baselines : Dict[str, latency_baseline] = {}
+        self._decreased_at = 0.0
+
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def on_sample(self, route: str, latency: float, failed: bool, in_flight: int) -> None:
+        baseline = self._baselines.get(route)
+        if not failed:
+            if baseline is None:
+                baseline = latency_baseline(latency)
+                self._baselines[route] = baseline
+            else:
+                baseline.record(latency)
+
+        congested = failed or (baseline is not None and baseline.is_rising)
+        now = time.monotonic()
+        if congested:
+            if now - self._decreased_at < DECREASE_COOLDOWN:
+                return
+            self._decreased_at = now
+            self.decreases += 1
+            self.limit = max(MIN_CONCURRENCY, self.limit * DECREASE_FACTOR)
+            trend = f"{baseline.trend:.2f}" if baseline is not None else "-"
+            logger.debug(f"Hub is congested ({route} failed: {failed}, latency trend {trend}), allowing {self.current} requests in flight")
+        elif in_flight + 1 >= self.current and self.limit < MAX_CONCURRENCY:
+            # Only grow when the limit is what holds the requests back
+            previous = self.current
+            self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            if self.current > previous:
+                self.increases += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit"             : self.current,
+            "increases"         : self.increases,
+            "decreases"         : self.decreases,
+            "latency"           : { route : baseline.as_dict() for route, baseline in sorted(self._baselines.items()) }
+        }
+
+# Hands out permits to send a request to the hub, highest priority first, at
+# no more than rate_limit requests/second (token bucket with a burst of the
+# same size, commands are exempt) and with no more requests in flight than the
+# adaptive limit. A rate_limit of 0 turns off the rate limit. Every permit is given back 
+# with release() once the request is done
+class request_scheduler:
+    def __init__(self, rate_limit: float) -> None:
+        self._rate = rate_limit
+        self._burst = max(1.0, rate_limit)
+        self._tokens = self._burst
+        self._refilled_at = time.monotonic()
+        self._queues = { priority : deque() for priority in RequestPriority }
+        self._wakeup_handle = None
+        self._wait_stats = { priority : priority_wait_stats() for priority in RequestPriority }
+        self._concurrency = adaptive_limit()
+        self._in_flight = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def _has_waiters(self) -> bool:
+        return any(len(queue) > 0 for queue in self._queues.values())
+
+    def _try_take_token(self) -> bool:
+        if self._rate <= 0:
+            return True
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _try_take_permit(self, priority: RequestPriority) -> bool:
+        # No token is taken when there is no room for another request in flight
+        if self._in_flight >= self._concurrency.current:
+            return False
+        if priority not in RATE_LIMIT_EXEMPT and not self._try_take_token():
+            self._schedule_wakeup()
+            return False
+        self._in_flight += 1
+        return True
+
+    async def acquire(self, priority: RequestPriority) -> None:
+        queued_at = time.monotonic()
+        if not self._has_waiters() and self._try_take_permit(priority):
+            self._wait_stats[priority].record(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in self._queues[priority]:
+                self._queues[priority].remove(future)
+            elif future.done() and not future.cancelled():
+                # Got the permit but is not going to use it
+                self.release()
+            raise
+        self._wait_stats[priority].record(time.monotonic() - queued_at)
+
+    def release(self, route: Optional[str] = None, latency: Optional[float] = None, failed: bool = False) -> None:
+        # latency is None when the request did not complete, e.g. cancelled.
+        # route is the kind of request, e.g. `GET /devices/{id}`
+        self._in_flight -= 1
+        if latency is not None:
+            self._concurrency.on_sample(route, latency, failed, self._in_flight)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for priority in RequestPriority:
+            queue = self._queues[priority]
+            while len(queue) > 0:
+                if queue[0].done():
+                    queue.popleft()
+                    continue
+                if not self._try_take_permit(priority):
+                    return
+                queue.popleft().set_result(None)
+
+    def _schedule_wakeup(self) -> None:
+        if self._wakeup_handle is not None:
+            return
+        delay = (1 - self._tokens) / self._rate
+        self._wakeup_handle = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup_handle = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_limit"    : self._rate,
+            "in_flight"     : self._in_flight,
+            "concurrency"   : self._concurrency.stats(),
+            "queued"        : { priority.name.lower() : len(self._queues[priority]) for priority in RequestPriority },
+            "queue_wait"    : { priority.name.lower() : self._wait_stats[priority].as_dict() for priority in RequestPriority }
+        }
@@ -0,0 +1,120 @@
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import aiohttp
+from homeassistant.util.ssl import get_default_no_verify_context
+from yarl import URL
+
+logger = logging.getLogger("custom_components.dirigera_platform")
+
+# Seconds to wait for a connection to the hub and for the hub to send data
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+# The hub is a small device, a handful of kept alive connections is plenty. The
+# requests in flight (see hub_scheduler) are never more than this
+POOL_CONNECTION_LIMIT = 8
+POOL_KEEPALIVE_TIMEOUT = 60
+
+class pool_stats:
+    def __init__(self) -> None:
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def make_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+
+    async def _on_connection_create_end(self, session, context, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session, context, params) -> None:
+        self.connections_reused += 1
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.connections_created + self.connections_reused
+        if total == 0:
+            return 0.0
+        return self.connections_reused / total
+
+# asyncio counterpart of the requests based get/patch/post/delete in dirigera.Hub
+# Goes through one keep-alive connection pool so the TLS handshake with the hub
+# is paid once per connection and not once per call. In HA the session is the
+# one created for the config entry (see async_setup_entry) and is closed by HA,
+# pass the pool_stats its trace config was made from. Without a session one is
+# created, e.g. when used outside HA. A closed transport is not opened again
+class hub_transport:
+    def __init__(
+        self, token: str, api_base_url: str, session: aiohttp.ClientSession = None, session_stats: pool_stats = None,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT
+    ) -> None:
+        self._token = token
+        self._api_base_url = api_base_url
+        self._timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        self._pool_stats = session_stats if session_stats is not None else pool_stats()
+        self._owns_session = session is None
+        if session is None:
+            # The hub uses a self signed certificate hence verification is
+            # turned off the same way the dirigera library does, HA's context
+            # for it is already loaded so nothing blocks the event loop
+            connector = aiohttp.TCPConnector(
+                                ssl=get_default_no_verify_context(),
+                                limit=POOL_CONNECTION_LIMIT,
+                                keepalive_timeout=POOL_KEEPALIVE_TIMEOUT)
+            session = aiohttp.ClientSession(
+                                connector=connector,
+                                trace_configs=[self._pool_stats.make_trace_config()])
+        self._session = session
+        self._is_closed = False
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._is_closed or self._session.closed:
+            raise RuntimeError("Hub transport is closed")
+        return self._session
+
+    def headers(self) -> Dict[str, Any]:
+        return {"Authorization": f"Bearer {self._token}"}
+
+    async def request(self, method: str, route: str, data: Optional[Union[Dict[str, Any], List[Any]]] = None) -> Any:
+        async with self.session.request(
+                                method,
+                                f"{self._api_base_url}{route}",
+                                headers=self.headers(),
+                                json=data,
+                                timeout=self._timeout) as response:
+            if not response.ok:
+                logger.debug(f"{method} {route} failed with {response.status} : {await response.text()}")
+            response.raise_for_status()
+
+            body = await response.read()
+            if len(body) == 0:
+                return None
+
+            if response.content_type != "application/json":
+                return body.decode()
+            return await response.json()
+
+    def stats(self) -> Dict[str, Any]:
+        open_connections = 0
+        if not self._session.closed:
+            connector = self._session.connector
+            # Idle connections kept alive plus the ones currently in use, of
+            # this hub only as HA's connector is shared with other integrations
+            host = URL(self._api_base_url).host
+            open_connections = sum(len(conns) for key, conns in getattr(connector, "_conns", {}).items() if key.host == host) \
+                                + sum(len(conns) for key, conns in getattr(connector, "_acquired_per_host", {}).items() if key.host == host)
+        return {
+            "open_connections"      : open_connections,
+            "connections_created"   : self._pool_stats.connections_created,
+            "connections_reused"    : self._pool_stats.connections_reused,
+            "reuse_ratio"           : round(self._pool_stats.reuse_ratio, 3)
+        }
+
+    async def async_close(self) -> None:
+        self._is_closed = True
+        # A session passed in belongs to whoever made it
+        if self._owns_session:
+            await self._session.close()
@@ -1,9 +1,14 @@
+import asyncio
 import logging 
+import time
 from enum import Enum
 
-from .dirigera_lib_patch import HubX
+from .dirigera_lib_patch import HubX, HackScene, dict_to_controller
+from .hub_event_listener import hub_event_listener, process_events_from
 from .scene import ikea_scene
+from .hub_scenes import scene_cache
 from .light import ikea_bulb
+from .const import DOMAIN
 from .base_classes import (
     ikea_blinds_device,
     ikea_starkvind_air_purifier_device,
@@ -15,10 +20,41 @@ from .base_classes import (
     ikea_water_sensor_device    
 )
 
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.storage import Store
+
 from dirigera.devices.scene import Trigger, TriggerDetails, EndTriggerEvent
+from dirigera.devices.light import dict_to_light
+from dirigera.devices.blinds import dict_to_blind
+from dirigera.devices.air_purifier import dict_to_air_purifier
+from dirigera.devices.outlet import dict_to_outlet
+from dirigera.devices.environment_sensor import dict_to_environment_sensor
+from dirigera.devices.open_close_sensor import dict_to_open_close_sensor
+from dirigera.devices.motion_sensor import dict_to_motion_sensor
+from dirigera.devices.water_sensor import dict_to_water_sensor
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
+INVENTORY_STORAGE_VERSION = 1
+INVENTORY_REFRESH_RETRY_SECONDS = 60
+
+# Scenes the integration creates for the controllers, see sensor.py
+EMPTY_SCENE_PREFIX = "dirigera_integration_empty_scene_"
+
+def inventory_store(hass, entry_id) -> Store:
+    return Store(hass, INVENTORY_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.inventory")
+
+def is_empty_scene(name: str) -> bool:
+    return name.startswith(EMPTY_SCENE_PREFIX)
+
+def inventory(devices_json, scenes_json) -> dict:
+    # The empty scenes are deleted and created again (with new ids) once the
+    # hub answers, a stored one would not be there on the next start
+    return {
+        "devices"   : devices_json,
+        "scenes"    : [scene_json for scene_json in scenes_json if not is_empty_scene(scene_json["info"]["name"])]
+    }
+
 class HubDeviceType(Enum):
     EMPTY_SCENE         = "empty_scene"
     SCENE               = "scene"
@@ -32,6 +68,34 @@ class HubDeviceType(Enum):
     MOTION_SENSOR       = "motion_sensor"
     WATER_SENSOR        = "water_sensor"
 
+# How each typed device list is picked out of the /devices snapshot, the
+# key/value checked is the same one the per type Hub.get_xxx() filters on
+DEVICE_PARTITIONS = {
+    HubDeviceType.LIGHT                 : ("type",          "light",                dict_to_light),
+    HubDeviceType.BLIND                 : ("type",          "blinds",               dict_to_blind),
+    HubDeviceType.AIR_PURIFIER          : ("type",          "airPurifier",          dict_to_air_purifier),
+    HubDeviceType.OUTLET                : ("type",          "outlet",               dict_to_outlet),
+    HubDeviceType.ENVIRONMENT_SENSOR    : ("deviceType",    "environmentSensor",    dict_to_environment_sensor),
+    HubDeviceType.CONTROLLER            : ("type",          "controller",           dict_to_controller),
+    HubDeviceType.OPEN_CLOSE_SENSOR     : ("deviceType",    "openCloseSensor",      dict_to_open_close_sensor),
+    HubDeviceType.MOTION_SENSOR         : ("deviceType",    "motionSensor",         dict_to_motion_sensor),
+    HubDeviceType.WATER_SENSOR          : ("deviceType",    "waterSensor",          dict_to_water_sensor),
+}
+
+def is_pushed(device_type: HubDeviceType) -> bool:
+    # The hub sends the state changes of the type on the event websocket
+    _, value, _ = DEVICE_PARTITIONS[device_type]
+    return value in process_events_from
+
+def partition_devices(hub, devices_json) -> dict:
+    partitioned = { device_type : [] for device_type in DEVICE_PARTITIONS }
+    for device_json in devices_json:
+        for device_type, (key, value, dict_to_fx) in DEVICE_PARTITIONS.items():
+            if device_json.get(key) == value:
+                partitioned[device_type].append(dict_to_fx(device_json, hub))
+                hub.remember_device_data(device_json)
+    return partitioned
+
 class ikea_gateway:
     def __init__(self):
         Trigger.update_forward_refs()
@@ -40,69 +104,270 @@ class ikea_gateway:
         
         logger.debug("dirigera_platform init...")
         self.devices = {}
+        self.discovery_stats = {}
+        self.is_stale = False
+        self.scene_cache = None
+
+    async def fetch_snapshot(self, hass, hub):
+        # Fetch /devices and /scenes once and in parallel, every typed list is then
+        # built from this one snapshot instead of a /devices round trip per type.
+        # The requests and time it took are logged and kept in discovery_stats
+        started_at = time.monotonic()
+        with hub.count_requests() as counter:
+            devices_json, scenes_json = await asyncio.gather(hub.async_get("/devices"), hub.async_get("/scenes"))
+        
+        self.discovery_stats = {
+            "hub_requests"  : counter.count,
+            "duration"      : time.monotonic() - started_at,
+            "devices"       : len(devices_json),
+            "scenes"        : len(scenes_json)
+        }
+        logger.info(f"Discovery of {len(devices_json)} devices and {len(scenes_json)} scenes complete with "
+                    f"{counter.count} hub requests in {self.discovery_stats['duration']:.3f}s")
+        return devices_json, scenes_json
+
+    async def make_devices(self, hass, hub: HubX, store: Store = None):
+        devices_json, scenes_json = await self.fetch_snapshot(hass, hub)
+        self.make_devices_from_snapshot(hass, hub, devices_json, scenes_json)
+        
+        if store is not None:
+            await store.async_save(inventory(devices_json, scenes_json))
+
+    async def make_devices_from_store(self, hass, hub: HubX, store: Store) -> bool:
+        # Warm start, build the devices from the last good snapshot without waiting
+        # for the hub. The devices are stale till async_refresh reconciles them
+        snapshot = await store.async_load()
+        if snapshot is None:
+            logger.debug("No stored device inventory found...")
+            return False
+        
+        registered = set(hub_event_listener.device_registry.keys())
+        try:
+            self.make_devices_from_snapshot(hass, hub, snapshot["devices"], snapshot["scenes"])
+        except Exception as ex:
+            logger.warning("Failed to build devices from stored inventory, will discover from hub...")
+            logger.warning(ex)
+            # Whatever got registered now points at devices that are being thrown
+            # away, the registry is shared with the other hubs so only that goes
+            for id in set(hub_event_listener.device_registry.keys()) - registered:
+                del hub_event_listener.device_registry[id]
+            self.devices = {}
+            return False
+        
+        logger.info(f"Built devices from stored inventory of {len(snapshot['devices'])} devices and {len(snapshot['scenes'])} scenes")
+        self.set_stale(True)
+        return True
+
+    async def async_refresh(self, hass, entry, hub: HubX, store: Store):
+        while True:
+            try:
+                devices_json, scenes_json = await self.fetch_snapshot(hass, hub)
+                break
+            except Exception as ex:
+                logger.warning(f"Failed to refresh device inventory from hub, retrying in {INVENTORY_REFRESH_RETRY_SECONDS} seconds...")
+                logger.warning(ex)
+                await asyncio.sleep(INVENTORY_REFRESH_RETRY_SECONDS)
+
+        await store.async_save(inventory(devices_json, scenes_json))
 
-    async def make_devices(self, hass, ip, token):
-        hub: HubX = HubX(token, ip)
+        if not self.reconcile(hub, partition_devices(hub, devices_json), scenes_json):
+            # Devices/scenes were added or removed, entities have to be recreated
+            logger.info("Device inventory on hub differs from stored inventory, reloading...")
+            hass.async_create_task(hass.config_entries.async_reload(entry.entry_id))
+            return 
         
+        logger.debug("Stored device inventory reconciled with hub...")
+        self.set_stale(False)
+        await self.async_make_empty_scenes(hub)
+
+    async def async_make_empty_scenes(self, hub: HubX):
+        # Hack to create empty scene so that we can associate it the controller
+        # so that click of buttons on the controller can generate events on the
+        # hub. Left out of the setup of the platforms so a hub that is down does
+        # not fail it, retried till the hub answers
+        while True:
+            try:
+                # Precuationary delete all empty scenes
+                await hub.async_run_in_executor(hub.delete_empty_scenes)
+                self.devices[HubDeviceType.EMPTY_SCENE] = []
+                for controller in self.controllers:
+                    clicks_supported = controller._json_data.capabilities.can_send
+                    clicks_supported = [ x for x in clicks_supported if x.endswith("Press") ]
+
+                    if len(clicks_supported) == 0:
+                        logger.debug(f"Ignoring controller for scene creation : {controller._json_data.id} as no press event supported : {controller._json_data.capabilities.can_send}")
+                        continue
+                    logger.debug(f"Will be creating empty scene for {controller._json_data.id}")
+                    await hub.async_run_in_executor(hub.create_empty_scene, controller._json_data.id, clicks_supported)
+                return
+            except Exception as ex:
+                logger.warning(f"Failed to create the empty scenes of the controllers, retrying in {INVENTORY_REFRESH_RETRY_SECONDS} seconds...")
+                logger.warning(ex)
+                await asyncio.sleep(INVENTORY_REFRESH_RETRY_SECONDS)
+
+    def reconcile(self, hub, partitioned, scenes_json) -> bool:
+        for device_type, models in partitioned.items():
+            current = { device.unique_id : device for device in self.get_devices(device_type) }
+            if set(current.keys()) != set([model.id for model in models]):
+                logger.debug(f"Inventory of {device_type.value} changed...")
+                return False
+            
+            for model in models:
+                device = current[model.id]
+                device._json_data = model
+                if isinstance(device, ikea_bulb):
+                    device.set_state()
+
+        # The empty scenes are made again once reconciled, see async_make_empty_scenes
+        current = set([scene.unique_id for scene in self.scenes])
+        if current != set([scene_json["id"] for scene_json in scenes_json if not is_empty_scene(scene_json["info"]["name"])]):
+            logger.debug("Inventory of scenes changed...")
+            return False
+        
+        self.scene_cache.load(scenes_json)
+        
+        return True
+
+    def set_stale(self, is_stale: bool):
+        self.is_stale = is_stale
+        for devices in self.devices.values():
+            for device in devices:
+                if hasattr(device, "is_stale"):
+                    device.is_stale = is_stale
+        self.update_all_entities()
+
+    def on_hub_availability_changed(self, is_available: bool):
+        # Entities take their availability from the hub, one pass has all of them
+        # show up as (un)available instead of each one finding out on its own poll
+        logger.debug(f"Hub availability changed to {is_available}, updating all entities...")
+        self.update_all_entities()
+
+    def set_coordinator(self, coordinator):
+        # Devices refresh through the hub wide poll instead of a request of their own
+        for devices in self.devices.values():
+            for device in devices:
+                if hasattr(device, "coordinator"):
+                    device.coordinator = coordinator
+
+    def apply_devices_snapshot(self, hub, devices_json) -> set:
+        # Merges a /devices poll into the devices held, returns the ids of the
+        # devices that changed. Devices not held are left to the inventory refresh
+        held = {}
+        for device_type, (_, _, dict_to_fx) in DEVICE_PARTITIONS.items():
+            for device in self.get_devices(device_type):
+                held[device.unique_id] = (device, dict_to_fx)
+
+        changed = set()
+        for device_json in devices_json:
+            device_id = device_json.get("id")
+            if device_id not in held or hub.is_unchanged_device_data(device_json):
+                continue
+
+            device, dict_to_fx = held[device_id]
+            if getattr(device, "is_moving", False):
+                # Its state comes from the movement tracked till it stops
+                continue
+            try:
+                model, is_changed = hub.decode_device(device_json, dict_to_fx, device._json_data)
+            except Exception as ex:
+                logger.warning(f"Failed to decode polled state of {device_id}, ignoring...")
+                logger.warning(ex)
+                continue
+
+            if not is_changed:
+                continue
+            if model is not device._json_data:
+                device._json_data = model
+                if isinstance(device, ikea_bulb):
+                    device.set_state()
+            changed.add(device_id)
+        return changed
+
+    def update_all_entities(self):
+        self.update_entities()
+
+    def update_entities(self, ids: set = None):
+        # Entities of the devices with the ids given, all when not given
+        for devices in self.devices.values():
+            for device in devices:
+                if ids is not None and device.unique_id not in ids:
+                    continue
+                if isinstance(device, Entity) and device.hass is None:
+                    # Not added to hass (yet), nothing to update
+                    continue
+                
+                device.schedule_update_ha_state(False)
+                registry_value = hub_event_listener.get_registry_entry(device.unique_id)
+                if registry_value is not None and registry_value.cascade_entity is not None:
+                    registry_value.cascade_entity.schedule_update_ha_state(False)
+
+    def make_devices_from_snapshot(self, hass, hub, devices_json, scenes_json):
         #Scenes
-        scenes = await hass.async_add_executor_job(hub.get_scenes)
+        self.scene_cache = scene_cache(hub)
+        scenes = self.scene_cache.load(scenes_json)
         logger.debug(f"Found {len(scenes)} scenes...")
-        empty_scenes = []
-        non_empty_scenes = []
+        self.devices[HubDeviceType.EMPTY_SCENE] = []
+        self.devices[HubDeviceType.SCENE] = []
         for scene in scenes:
-            if scene.name.startswith("dirigera_integration_empty_scene_"):
-                empty_scenes.append(ikea_scene(hub,scene))
-            else:
-                non_empty_scenes.append(ikea_scene(hub,scene))
+            self.add_scene(hub, scene)
 
-        self.devices[HubDeviceType.EMPTY_SCENE] = empty_scenes        
-        self.devices[HubDeviceType.SCENE] = non_empty_scenes
+        partitioned = partition_devices(hub, devices_json)
 
         #Light
-        lights = await hass.async_add_executor_job(hub.get_lights)
+        lights = partitioned[HubDeviceType.LIGHT]
         logger.debug(f"Found {len(lights)} total of all light devices to setup...")
         self.devices[HubDeviceType.LIGHT] = [ikea_bulb(hub, light) for light in lights]
         
         #Cover
-        blinds = await hass.async_add_executor_job(hub.get_blinds)
-        logger.debug(f"Found {len(lights)} total of all blinds devices to setup...")
+        blinds = partitioned[HubDeviceType.BLIND]
+        logger.debug(f"Found {len(blinds)} total of all blinds devices to setup...")
         self.devices[HubDeviceType.BLIND] = [ikea_blinds_device(hass, hub, b) for b in blinds]
         
         #Air Purifier
-        air_purifiers = await hass.async_add_executor_job(hub.get_air_purifiers)
+        air_purifiers = partitioned[HubDeviceType.AIR_PURIFIER]
         logger.debug(f"Found {len(air_purifiers)} total of all air purifiers devices to setup...")
         self.devices[HubDeviceType.AIR_PURIFIER] = [ikea_starkvind_air_purifier_device(hass, hub, a) for a in air_purifiers]
 
         #Outlets
-        outlets = await hass.async_add_executor_job(hub.get_outlets)
+        outlets = partitioned[HubDeviceType.OUTLET]
         logger.debug(f"Found {len(outlets)} total of all outlets devices to setup...")
         self.devices[HubDeviceType.OUTLET] = [ ikea_outlet_device(hass, hub, x) for x in outlets ]
         
         #Environment Sensor
-        environment_sensors = await hass.async_add_executor_job(hub.get_environment_sensors)
+        environment_sensors = partitioned[HubDeviceType.ENVIRONMENT_SENSOR]
         logger.debug(f"Found {len(environment_sensors)} total of all environment devices entities to setup...")
         self.devices[HubDeviceType.ENVIRONMENT_SENSOR] = [ikea_vindstyrka_device(hass, hub, env_device) for env_device in environment_sensors]
 
         #Controllers
-        controllers = await hass.async_add_executor_job(hub.get_controllers)
+        controllers = partitioned[HubDeviceType.CONTROLLER]
         logger.debug(f"Found {len(controllers)} total of all controllers devices to setup...")
         self.devices[HubDeviceType.CONTROLLER] = [ikea_controller_device(hass, hub, x) for x in controllers]
         
         #Open Close Sensors
-        open_close_sensors = await hass.async_add_executor_job(hub.get_open_close_sensors)
+        open_close_sensors = partitioned[HubDeviceType.OPEN_CLOSE_SENSOR]
         logger.debug(f"Found {len(open_close_sensors)} total of all open_close devices to setup...")
         self.devices[HubDeviceType.OPEN_CLOSE_SENSOR] = [ikea_open_close_device(hass, hub, x) for x in open_close_sensors]
         
         #Motion Sensors
-        motion_sensors = await hass.async_add_executor_job(hub.get_motion_sensors)
+        motion_sensors = partitioned[HubDeviceType.MOTION_SENSOR]
         logger.debug(f"Found {len(motion_sensors)} total of all motion_sensors devices to setup...")
         self.devices[HubDeviceType.MOTION_SENSOR] = [ikea_motion_sensor_device(hass, hub, x) for x in motion_sensors]
         
         #Water Sensors
-        water_sensors = await hass.async_add_executor_job(hub.get_water_sensors)
+        water_sensors = partitioned[HubDeviceType.WATER_SENSOR]
         logger.debug(f"Found {len(water_sensors)} total of all water_sensors devices to setup...")
         self.devices[HubDeviceType.WATER_SENSOR] = [ikea_water_sensor_device(hass, hub, x) for x in water_sensors]
 
+    def add_scene(self, hub, scene: HackScene) -> ikea_scene:
+        # None for the empty scenes created for the controllers, those are
+        # kept apart from the scenes shown
+        entity = ikea_scene(hub, scene, self.scene_cache)
+        if is_empty_scene(scene.name):
+            self.empty_scenes.append(entity)
+            return None
+        self.scenes.append(entity)
+        return entity
+
     def get_devices(self, key):
         if key not in self.devices:
             self.devices[key]=[]
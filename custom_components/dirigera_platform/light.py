@@ -1,7 +1,6 @@
 import logging
 from typing import Optional
 
-from dirigera import Hub
 from dirigera.devices.device import Room
 from dirigera.devices.light import Light
 
@@ -18,8 +17,10 @@ from homeassistant.const import CONF_IP_ADDRESS, CONF_TOKEN
 from homeassistant.core import HomeAssistantError
 from homeassistant.helpers.entity import DeviceInfo
 
-from .const import DOMAIN, CONF_HIDE_DEVICE_SET_BULBS, PLATFORM
-from .hub_event_listener import hub_event_listener, registry_entry
+from .const import DOMAIN, CONF_HIDE_DEVICE_SET_BULBS, PLATFORM, HUB
+from .dirigera_lib_patch import HubX
+from .hub_event_listener import hub_event_listener, registry_entry, are_pushed
+from .hub_resilience import HubUnavailableError
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
@@ -33,8 +34,7 @@ async def async_setup_entry(
     config = hass.data[DOMAIN][config_entry.entry_id]
     logger.debug(config)
 
-    # hub = dirigera.Hub(config[CONF_TOKEN], config[CONF_IP_ADDRESS])
-    hub = Hub(config[CONF_TOKEN], config[CONF_IP_ADDRESS])
+    hub : HubX = config[HUB]
 
     #Backward compatibility
     hide_device_set_bulbs = True
@@ -111,6 +111,10 @@ class ikea_bulb(LightEntity):
         self._hub = hub
         self._json_data = json_data
         self._ignore_update = False 
+        # Set while the state comes from the stored inventory and not the hub
+        self.is_stale = False
+        # Set when the hub wide poll (hub_coordinator) refreshes the bulb
+        self.coordinator = None
 
         # Register the device for updates
         hub_event_listener.register(self._json_data.id, registry_entry(self))
@@ -170,6 +174,17 @@ class ikea_bulb(LightEntity):
     @property
     def should_poll(self) -> bool:
         return False 
+
+    @property
+    def hub_attributes(self) -> list:
+        attributes = ["isOn", "lightLevel", "colorTemperature"]
+        if ColorMode.HS in self._supported_color_modes:
+            attributes.extend(["colorHue", "colorSaturation"])
+        return attributes
+
+    @property
+    def is_push_only(self) -> bool:
+        return are_pushed(self._json_data.device_type, self.hub_attributes)
     
     @property
     def unique_id(self):
@@ -177,7 +192,11 @@ class ikea_bulb(LightEntity):
 
     @property
     def available(self):
-        return self._json_data.is_reachable
+        return self._hub.is_available and self._json_data.is_reachable
+
+    @property
+    def assumed_state(self) -> bool:
+        return self.is_stale
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -230,6 +249,13 @@ class ikea_bulb(LightEntity):
     def color_temp_kelvin(self):
         return self._json_data.attributes.color_temperature
 
+    def clamp_color_temperature(self, kelvin: int) -> int:
+        # Within what the bulb takes, the hub checks it against its range
+        low, high = self.min_color_temp_kelvin, self.max_color_temp_kelvin
+        if low is None or high is None:
+            return kelvin
+        return max(low, min(high, kelvin))
+
     @property
     def color_temperature(self):
         return self._json_data.attributes.color_temperature
@@ -275,10 +301,14 @@ class ikea_bulb(LightEntity):
         self._color_mode = value 
 
     async def async_update(self):
+        # Only called when an update is asked for with the hub wide poll, see
+        # ikea_base_device
         try:
             logger.debug("async update called on bulb..")
-            self._json_data = await self.hass.async_add_executor_job(self._hub.get_light_by_id, self._json_data.id)
+            self._json_data = await self._hub.async_get_light_by_id(self._json_data.id, current=self._json_data)
             self.set_state()
+        except HubUnavailableError:
+            logger.debug(f"update skipped for {self.name} as hub is unavailable...")
         except Exception as ex:
             logger.error("error encountered running update on : {}".format(self.name))
             logger.error(ex)
@@ -291,34 +321,37 @@ class ikea_bulb(LightEntity):
         try:
             # Probably change
             self.reset_ignore_update()
-            await self.hass.async_add_executor_job(self._json_data.set_light,True)
+            # All requested attributes go to the hub as one PATCH
+            attributes = {"isOn": True}
 
             if ATTR_BRIGHTNESS in kwargs:
                 # brightness requested
-                # The setter will move the HASS value of 0-100 to 1-255
-                self.light_level = int(kwargs[ATTR_BRIGHTNESS])
-                logger.debug("scaled brightness : {}".format(self.light_level))
-                # update
-                await self.hass.async_add_executor_job(self._json_data.set_light_level,self.light_level)
-                self._ignore_update = True 
+                # HASS sends 0-255, the hub takes 1-100. Not set on the bulb here,
+                # the model only takes it once the hub has the command else the
+                # unchanged check would compare it with itself
+                level = max(1, min(100, int((int(kwargs[ATTR_BRIGHTNESS]) / 255) * 100)))
+                logger.debug("scaled brightness : {}".format(level))
+                attributes["lightLevel"] = level
 
             if ATTR_COLOR_TEMP_KELVIN in kwargs:
                 # color temp requested
                 # If request is white then brightness is passed
                 logger.debug("Request to set color temp...")
-                ct = kwargs[ATTR_COLOR_TEMP_KELVIN]
+                ct = self.clamp_color_temperature(kwargs[ATTR_COLOR_TEMP_KELVIN])
                 logger.debug("Set CT : {}".format(ct))
-                await self.hass.async_add_executor_job(self._json_data.set_color_temperature,ct)
-                self._ignore_update = True 
+                attributes["colorTemperature"] = ct
 
             if ATTR_HS_COLOR in kwargs:
                 logger.debug("Request to set color HS")
                 hs_tuple = kwargs[ATTR_HS_COLOR]
-                self._color_hue = hs_tuple[0]
-                self._color_saturation = hs_tuple[1] / 100
+                self._color_hue = max(0, min(360, hs_tuple[0]))
+                self._color_saturation = max(0.0, min(1.0, hs_tuple[1] / 100))
                 # Saturation is 0 - 1 at IKEA
-               
-                await self.hass.async_add_executor_job(self._json_data.set_light_color,self._color_hue, self._color_saturation)
+                attributes["colorHue"] = self._color_hue
+                attributes["colorSaturation"] = self._color_saturation
+            
+            sent = await self._hub.async_set_attributes(self._json_data, attributes, skip_unchanged=not self.is_stale)
+            if sent and len(attributes) > 1:
                 self._ignore_update = True 
             self.async_schedule_update_ha_state(False)
         except Exception as ex:
@@ -330,7 +363,7 @@ class ikea_bulb(LightEntity):
         logger.debug("light turn_off...")
         try:
             self.reset_ignore_update()
-            await self.hass.async_add_executor_job(self._json_data.set_light,False)
+            await self._hub.async_set_attributes(self._json_data, {"isOn": False}, skip_unchanged=not self.is_stale)
             self.async_schedule_update_ha_state(False)
         except Exception as ex:
             logger.error("error encountered turning off : {}".format(self.name))
@@ -369,6 +402,10 @@ class ikea_bulb_device_set(LightEntity):
     def available(self):
         return self._controller.available
 
+    @property
+    def assumed_state(self) -> bool:
+        return self._controller.assumed_state
+
     @property
     def device_info(self) -> DeviceInfo:
 
@@ -431,10 +468,16 @@ class ikea_bulb_device_set(LightEntity):
             logger.error(ex)
             raise HomeAssistantError(ex, DOMAIN, "hub_exception")
 
-    def patch_command(self, key_val : dict):
+    def is_unchanged(self, key_val : dict) -> bool:
+        # The set is only left alone when every bulb in it is already there
+        if self._controller.is_stale:
+            return False
+        return self._hub.skip_unchanged([light._json_data for light in self._device_set.get_lights()], key_val)
+
+    async def async_patch_command(self, key_val : dict):
         data = [{"attributes" : key_val}]
         try:
-            self._hub.patch(self._patch_url, data=data)
+            await self._hub.async_patch(self._patch_url, data=data)
         except Exception as ex:
             logger.error("error encountered running update on : {}".format(self.name))
             logger.error(ex)
@@ -448,7 +491,8 @@ class ikea_bulb_device_set(LightEntity):
 
         try:
             self._controller.reset_ignore_update()
-            await self.hass.async_add_executor_job(self.patch_command,{"isOn": True})
+            # All requested attributes go to the hub as one PATCH
+            attributes = {"isOn": True}
 
             if ATTR_BRIGHTNESS in kwargs:
                 # brightness requested
@@ -461,27 +505,30 @@ class ikea_bulb_device_set(LightEntity):
                 # This is in the 1-100 level so scale it 
                 logger.debug("Set brightness : {}".format(level))
                 logger.debug("Set scaled brightness : {}".format(int((level / 255) * 100)))
-                await self.hass.async_add_executor_job(self.patch_command, {"lightLevel" : int((level / 255) * 100)})
-                self._controller._ignore_update = True 
+                attributes["lightLevel"] = max(1, min(100, int((level / 255) * 100)))
 
             if ATTR_COLOR_TEMP_KELVIN in kwargs:
                 # color temp requested
                 # If request is white then brightness is passed
                 logger.debug("Request to device_set set color temp...")
-                ct = kwargs[ATTR_COLOR_TEMP_KELVIN]
+                ct = self._controller.clamp_color_temperature(kwargs[ATTR_COLOR_TEMP_KELVIN])
                 logger.debug("Set CT : {}".format(ct))
-                await self.hass.async_add_executor_job(self.patch_command, {"colorTemperature" : ct})
-                self._controller._ignore_update = True 
+                attributes["colorTemperature"] = ct
 
             if ATTR_HS_COLOR in kwargs:
                 logger.debug("Request to set color HS device_set")
                 hs_tuple = kwargs[ATTR_HS_COLOR]
-                self._color_hue = hs_tuple[0]
-                self._color_saturation = hs_tuple[1] / 100
+                self._color_hue = max(0, min(360, hs_tuple[0]))
+                self._color_saturation = max(0.0, min(1.0, hs_tuple[1] / 100))
                 # Saturation is 0 - 1 at IKEA
+                attributes["colorHue"] = self._color_hue
+                attributes["colorSaturation"] = self._color_saturation
+            
+            if self.is_unchanged(attributes):
+                return
+            if len(attributes) > 1:
                 self._controller._ignore_update = True 
-                
-                await self.hass.async_add_executor_job(self.patch_command,{ "colorHue" : self._color_hue, "colorSaturation" : self._color_saturation})
+            await self.async_patch_command(attributes)
 
         except Exception as ex:
             logger.error("error encountered turning on device_set : {}".format(self.name))
@@ -492,7 +539,9 @@ class ikea_bulb_device_set(LightEntity):
         self._controller.reset_ignore_update()
         logger.debug("light device_set turn_off...")
         try:
-            await self.hass.async_add_executor_job(self.patch_command, {"isOn": False})
+            if self.is_unchanged({"isOn": False}):
+                return
+            await self.async_patch_command({"isOn": False})
         except Exception as ex:
             logger.error("error encountered turning off device_set : {}".format(self.name))
             logger.error(ex)
@@ -5,13 +5,13 @@ from typing import Any
 
 #from dirigera import Hub
 from .dirigera_lib_patch import HubX, HackScene
+from .hub_scenes import scene_cache
 #from dirigera.devices.scene import Scene as DirigeraScene
 #from dirigera.devices.scene import Trigger, TriggerDetails, EndTriggerEvent
 
 from homeassistant.components.scene import Scene
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 from .const import DOMAIN, PLATFORM
@@ -30,7 +30,16 @@ async def async_setup_entry(
     #TriggerDetails.update_forward_refs()
     #EndTriggerEvent.update_forward_refs()
 
-    async_add_entities(hass.data[DOMAIN][PLATFORM].scenes)
+    platform = hass.data[DOMAIN][PLATFORM]
+    async_add_entities(platform.scenes)
+
+    # Scenes created on the hub later on are added as the hub announces them
+    def on_scene_created(scene: HackScene):
+        entity = platform.add_scene(scene.hub, scene)
+        if entity is not None:
+            async_add_entities([entity])
+
+    platform.scene_cache.set_created_listener(on_scene_created)
     logger.debug("async_setup_entry complete for scenes...")
 
 class ikea_scene(Scene):
@@ -38,38 +47,50 @@ class ikea_scene(Scene):
 
     _attr_has_entity_name = True
 
-    def __init__(self, hub: HubX, scene: HackScene) -> None:
+    def __init__(self, hub: HubX, scene: HackScene, scenes: scene_cache) -> None:
         """Initialize."""
         self._hub = hub
         self._scene = scene 
+        self._scenes = scenes
+        scenes.add_listener(scene.id, self._on_scene_changed)
     
+    def _on_scene_changed(self) -> None:
+        if self.hass is not None:
+            self.async_write_ha_state()
+
+    @property
+    def _current_scene(self) -> HackScene:
+        # Kept as last known once deleted on the hub
+        scene = self._scenes.get(self._scene.id)
+        if scene is not None:
+            self._scene = scene
+        return self._scene
+
+    @property
+    def should_poll(self) -> bool:
+        return False
+
     @property
     def unique_id(self):
         return self._scene.id 
     
+    @property
+    def available(self) -> bool:
+        return self._hub.is_available and self._scenes.get(self._scene.id) is not None
+
     @property
     def name(self) -> str:
         """Return name from Dirigera."""
         #return self._dirigera_scene.info.name
-        return self._scene.name 
+        return self._current_scene.name 
     
     @property
     def icon(self) -> str:
         """Return suitable replacement icon."""
         #return to_hass_icon(self._dirigera_scene.info.icon)
-        return ikea_to_hass_icon(self._scene.icon)
+        return ikea_to_hass_icon(self._current_scene.icon)
     
     async def async_activate(self, **kwargs: Any) -> None:
         """Trigger Dirigera Scene."""
         logger.debug("Activating scene '%s' (%s)", self.name, self.unique_id)
-        await self.hass.async_add_executor_job(self._scene.trigger)
-
-    async def async_update(self) -> None:
-        """Fetch updated scene definition from Dirigera."""
-        logger.debug("Updating scene '%s' (%s)", self.name, self.unique_id)
-        try:
-            self._dirigera_scene = await self.hass.async_add_executor_job(self._hub.get_scene_by_id, self.unique_id)
-        except Exception as ex:
-            logger.error("Error encountered on update of '%s' (%s)", self.name, self.unique_id)
-            logger.error(ex)
-            raise HomeAssistantError from ex
\ No newline at end of file
+        await self._hub.async_trigger_scene(self._scene.id)
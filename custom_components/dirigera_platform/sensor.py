@@ -27,7 +27,7 @@ from homeassistant.const import CONF_IP_ADDRESS, CONF_TOKEN
 from homeassistant.core import HomeAssistantError
 from homeassistant.helpers.entity import EntityCategory
 
-from .const import DOMAIN, PLATFORM
+from .const import DOMAIN, PLATFORM, HUB
 
 logger = logging.getLogger("custom_components.dirigera_platform")
 
@@ -41,14 +41,12 @@ async def async_setup_entry(
 
     config = hass.data[DOMAIN][config_entry.entry_id]
 
-    hub = HubX(config[CONF_TOKEN], config[CONF_IP_ADDRESS])
+    hub : HubX = config[HUB]
 
     platform: ikea_gateway = hass.data[DOMAIN][PLATFORM]
 
-    # Precuationary delete all empty scenes
-    if len(platform.empty_scenes) > 0:
-        await hass.async_add_executor_job(hub.delete_empty_scenes)
-
+    # The empty scenes of the controllers are made once the hub answers, see
+    # ikea_gateway.async_make_empty_scenes
     await add_controllers_sensors(hass, async_add_entities, hub, platform.controllers)
     await add_environment_sensors(async_add_entities, platform.environment_sensors)
     await add_outlet_power_attrs(async_add_entities, platform.outlets)
@@ -161,17 +159,6 @@ async def add_controllers_sensors(hass, async_add_entities, hub, controllers):
     # battery % attribute which we shall use to identify
     controller_entities = []
     for controller in controllers:
-        # Hack to create empty scene so that we can associate it the controller
-        # so that click of buttons on the controller can generate events on the hub
-        clicks_supported = controller._json_data.capabilities.can_send
-        clicks_supported = [ x for x in clicks_supported if x.endswith("Press") ]
-
-        if len(clicks_supported) == 0:
-            logger.debug(f"Ignoring controller for scene creation : {controller._json_data.id} as no press event supported : {controller._json_data.capabilities.can_send}")
-        else:
-            logger.debug(f"Will be creating empty scene for {controller._json_data.id}")
-            await hass.async_add_executor_job(hub.create_empty_scene,controller._json_data.id, clicks_supported)
-
         if getattr(controller._json_data.attributes,"battery_percentage",None) is not None:
             controller_entities.append(controller)
 
@@ -0,0 +1,32 @@
+from custom_components.dirigera_platform.hub_scheduler import INITIAL_CONCURRENCY, adaptive_limit
+
+DEVICE_READ = "GET /devices/{id}"
+DEVICE_COMMAND = "PATCH /devices/{id}"
+ALL_DEVICES = "GET /devices"
+
+def test_slow_poll_of_all_devices_does_not_shrink_limit():
+    limit = adaptive_limit()
+    for _ in range(10):
+        limit.on_sample(DEVICE_READ, 0.02, False, 0)
+        limit.on_sample(DEVICE_COMMAND, 0.03, False, 0)
+
+    # A healthy hub takes much longer for all the devices than for one
+    limit.on_sample(ALL_DEVICES, 0.8, False, 0)
+    for _ in range(10):
+        limit.on_sample(DEVICE_READ, 0.02, False, 0)
+        limit.on_sample(DEVICE_COMMAND, 0.03, False, 0)
+    limit.on_sample(ALL_DEVICES, 0.85, False, 0)
+
+    assert limit.current == INITIAL_CONCURRENCY
+    assert limit.decreases == 0
+
+def test_rising_latency_of_a_kind_shrinks_limit():
+    limit = adaptive_limit()
+    for _ in range(10):
+        limit.on_sample(DEVICE_READ, 0.02, False, 0)
+
+    for _ in range(5):
+        limit.on_sample(DEVICE_READ, 0.5, False, 0)
+
+    assert limit.current == INITIAL_CONCURRENCY // 2
+    assert limit.decreases == 1
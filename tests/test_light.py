@@ -0,0 +1,70 @@
+import asyncio
+
+from dirigera.devices.light import dict_to_light
+from homeassistant.components.light import ATTR_BRIGHTNESS
+
+from custom_components.dirigera_platform.dirigera_lib_patch import HubX
+from custom_components.dirigera_platform.light import ikea_bulb
+
+LIGHT = {
+    "id": "light1",
+    "type": "light",
+    "deviceType": "light",
+    "createdAt": "2023-01-01T00:00:00.000Z",
+    "isReachable": True,
+    "lastSeen": "2023-01-01T00:00:00.000Z",
+    "attributes": {
+        "customName": "Lamp",
+        "model": "TRADFRI bulb",
+        "manufacturer": "IKEA of Sweden",
+        "firmwareVersion": "1.0",
+        "hardwareVersion": "1",
+        "isOn": True,
+        "lightLevel": 50,
+    },
+    "capabilities": {"canSend": [], "canReceive": ["isOn", "lightLevel"]},
+    "room": None,
+    "deviceSet": [],
+    "remoteLinks": [],
+}
+
+def make_hub(requests: list) -> HubX:
+    # Commands that would not change the bulb are skipped, as by default
+    hub = HubX("token", "127.0.0.1", elide_commands=True)
+
+    async def request(method, route, data=None):
+        requests.append((method, route, data))
+        return None
+
+    hub._transport.request = request
+    return hub
+
+def test_brightness_change_of_bulb_already_on_is_sent():
+    async def run():
+        requests = []
+        hub = make_hub(requests)
+        bulb = ikea_bulb(hub, dict_to_light(LIGHT, hub))
+        bulb.async_schedule_update_ha_state = lambda force_refresh=False: None
+        try:
+            await bulb.async_turn_on(**{ATTR_BRIGHTNESS: 255})
+        finally:
+            await hub.async_close()
+        return requests, bulb
+
+    requests, bulb = asyncio.run(run())
+    assert requests == [("PATCH", "/devices/light1", [{"attributes": {"isOn": True, "lightLevel": 100}}])]
+    assert bulb.light_level == 100
+
+def test_unchanged_brightness_of_bulb_already_on_is_skipped():
+    async def run():
+        requests = []
+        hub = make_hub(requests)
+        bulb = ikea_bulb(hub, dict_to_light(LIGHT, hub))
+        bulb.async_schedule_update_ha_state = lambda force_refresh=False: None
+        try:
+            await bulb.async_turn_on(**{ATTR_BRIGHTNESS: 128})
+        finally:
+            await hub.async_close()
+        return requests
+
+    assert asyncio.run(run()) == []
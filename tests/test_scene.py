@@ -0,0 +1,29 @@
+import asyncio
+from types import SimpleNamespace
+
+from custom_components.dirigera_platform import scene
+from custom_components.dirigera_platform.const import DOMAIN, PLATFORM
+from custom_components.dirigera_platform.dirigera_lib_patch import HubX
+from custom_components.dirigera_platform.ikea_gateway import ikea_gateway
+
+def scene_json(id_: str, name: str) -> dict:
+    return {"id": id_, "info": {"name": name, "icon": "scenes_clapper"}, "type": "userScene"}
+
+def test_scene_created_on_hub_is_added():
+    async def run():
+        hub = HubX("token", "127.0.0.1")
+        platform = ikea_gateway()
+        platform.make_devices_from_snapshot(None, hub, [], [scene_json("scene1", "Movie")])
+        hass = SimpleNamespace(data={DOMAIN: {PLATFORM: platform}})
+
+        added = []
+        await scene.async_setup_entry(hass, None, lambda entities: added.append([entity.name for entity in entities]))
+        platform.scene_cache.on_event({"type": "sceneCreated", "data": scene_json("scene2", "Dinner")})
+        platform.scene_cache.on_event({"type": "sceneCreated", "data": scene_json("scene3", "dirigera_integration_empty_scene_x")})
+        await hub.async_close()
+        return added, platform
+
+    added, platform = asyncio.run(run())
+    assert added == [["Movie"], ["Dinner"]]
+    assert [entity.unique_id for entity in platform.scenes] == ["scene1", "scene2"]
+    assert [entity.unique_id for entity in platform.empty_scenes] == ["scene3"]